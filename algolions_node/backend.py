@@ -0,0 +1,172 @@
+import json
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from algolions_node.metrics import METRICS
+from algolions_node.util import log, save_json_atomic
+
+
+# One keep-alive connection pool for every call to the backend API
+class BackendClient:
+    def __init__(self, api_base, api_key=None, pool_size=10):
+        self.api_base = api_base.rstrip("/")
+        self.api_key = api_key
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _headers(self, auth, extra=None):
+        headers = dict(extra or {})
+        if auth and self.api_key:
+            headers["x-api-key"] = self.api_key
+        return headers or None
+
+    def get(self, path, timeout=10, auth=False, endpoint=None):
+        return self._request("GET", path, endpoint, headers=self._headers(auth), timeout=timeout)
+
+    def post(self, path, data=None, json=None, files=None, auth=False, timeout=15, endpoint=None, headers=None):
+        return self._request("POST", path, endpoint, data=data, json=json, files=files,
+                             headers=self._headers(auth, headers), timeout=timeout)
+
+    def _request(self, method, path, endpoint, **kwargs):
+        # `endpoint` names the call in metrics when the path carries an id
+        started = time.time()
+        ok = False
+        try:
+            r = self.session.request(method, f"{self.api_base}{path}", **kwargs)
+            ok = r.ok
+            return r
+        finally:
+            METRICS.record_call("backend", endpoint or path, time.time() - started, ok)
+
+
+# Durable queue of bookkeeping updates (tx hashes, executor, claim and failure notices)
+# delivered by a background thread, so backend slowness never blocks a job. Entries are
+# keyed (e.g. "tx_hash:<job_id>"): a newer update for the same key replaces the pending
+# one instead of queueing behind it. Pending entries are persisted and resent after a restart.
+class Outbox:
+    def __init__(self, client, path, base_delay=2.0, max_delay=300.0, max_attempts=50):
+        self.client = client
+        self.path = path
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        self._cond = threading.Condition()
+        self._items = {}
+        self._seq = 0
+        self._thread = None
+        self._stopped = False
+        if os.path.exists(path):
+            try:
+                with open(path) as f:
+                    self._items = {item["key"]: item for item in json.load(f)}
+            except (OSError, ValueError) as e:
+                log(f"Could not load outbox {path}: {e}", "WARN")
+            self._seq = max((item["seq"] for item in self._items.values()), default=0)
+            if self._items:
+                log(f"Outbox: resending {len(self._items)} pending backend update(s)", "INFO")
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="backend-outbox", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+
+    def put(self, key, path, data, auth=False, label=None):
+        with self._cond:
+            existing = self._items.get(key)
+            if existing is None:
+                self._seq += 1
+            self._items[key] = {
+                "key": key,
+                "seq": existing["seq"] if existing else self._seq,
+                "path": path,
+                "data": data,
+                "auth": auth,
+                "label": label or key,
+                "attempts": 0,
+                "next_at": 0.0,
+            }
+            self._persist()
+            self._cond.notify_all()
+
+    def pending_count(self):
+        with self._cond:
+            return len(self._items)
+
+    def flush(self, timeout=None):
+        # Waits until everything queued has been delivered (or dropped)
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while self._items:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def _persist(self):
+        try:
+            save_json_atomic(self.path, sorted(self._items.values(), key=lambda i: i["seq"]))
+        except OSError as e:
+            log(f"Could not persist outbox: {e}", "WARN")
+
+    def _next_due(self):
+        # Called with the lock held; returns (item, seconds until due)
+        if not self._items:
+            return None, None
+        item = min(self._items.values(), key=lambda i: (i["next_at"], i["seq"]))
+        return item, max(item["next_at"] - time.time(), 0)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._stopped:
+                        return
+                    item, wait = self._next_due()
+                    if item is not None and wait == 0:
+                        item = dict(item)
+                        break
+                    self._cond.wait(wait)
+            ok, retry = self._deliver(item)
+            with self._cond:
+                current = self._items.get(item["key"])
+                # A newer update for this key arrived while sending; keep that one
+                if current is not None and current["data"] == item["data"]:
+                    if ok or not retry or current["attempts"] + 1 >= self.max_attempts:
+                        if not ok:
+                            log(f"Giving up on backend update {item['label']}", "ERR")
+                        del self._items[item["key"]]
+                    else:
+                        current["attempts"] += 1
+                        delay = min(self.base_delay * 2 ** current["attempts"], self.max_delay)
+                        current["next_at"] = time.time() + delay * random.uniform(0.5, 1.5)
+                    self._persist()
+                self._cond.notify_all()
+
+    def _deliver(self, item):
+        # Returns (delivered, worth retrying)
+        try:
+            r = self.client.post(item["path"], data=item["data"], auth=item["auth"])
+        except requests.RequestException as e:
+            log(f"Backend update {item['label']} failed: {e}", "WARN")
+            return False, True
+        if r.ok:
+            log(f"Backend updated: {item['label']}", "INFO")
+            return True, False
+        log(f"Backend update {item['label']} failed ({r.status_code}): {r.text.strip()}", "WARN")
+        # Client errors other than timeouts/rate limits will not succeed on retry
+        return False, r.status_code >= 500 or r.status_code in (408, 429)
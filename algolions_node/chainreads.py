@@ -0,0 +1,143 @@
+import threading
+import time
+from collections import namedtuple
+
+import requests
+from web3 import Web3
+
+from algolions_node.metrics import METRICS
+from algolions_node.util import log
+
+# Field order of the JobLogger `jobs(uint256)` getter
+JobRecord = namedtuple("JobRecord", [
+    "submitter", "executor", "model_cid", "data_cid", "result_hash",
+    "submitted_at", "claimed_at", "completed_at", "cleaned_at",
+    "status", "error_code", "error_msg", "paid",
+])
+
+STATUS_SUBMITTED = 0
+STATUS_CLAIMED = 1
+STATUS_COMPLETED = 2
+STATUS_FAILED = 3
+
+
+class BatchUnsupported(Exception):
+    pass
+
+
+class InstrumentedHTTPProvider(Web3.HTTPProvider):
+    # Counts and times every JSON-RPC call web3 makes, per method
+    def make_request(self, method, params):
+        started = time.time()
+        ok = False
+        try:
+            response = super().make_request(method, params)
+            ok = "error" not in response
+            return response
+        finally:
+            METRICS.record_call("rpc", method, time.time() - started, ok)
+
+
+# Validates a whole poll's worth of candidate jobs in one JSON-RPC batch
+# (eth_blockNumber + jobCount + jobs(i) for every candidate). RPC endpoints that
+# reject batches fall back to individual calls for the rest of the process lifetime.
+class ChainReader:
+    def __init__(self, web3, contract, rpc_url=None, session=None, timeout=15):
+        self.web3 = web3
+        self.contract = contract
+        self.rpc_url = rpc_url
+        self.session = session or requests.Session()
+        self.timeout = timeout
+        self.batching = rpc_url is not None
+        self._lock = threading.Lock()
+        self._count_block = None
+        self._count = None
+        self._jobs_selector = bytes(web3.keccak(text="jobs(uint256)")[:4])
+        self._job_count_data = web3.to_hex(web3.keccak(text="jobCount()")[:4])
+        jobs_abi = next(x for x in contract.abi if x.get("type") == "function" and x["name"] == "jobs")
+        self._jobs_types = [o["type"] for o in jobs_abi["outputs"]]
+
+    def cached_job_count(self, block):
+        # jobCount as of `block` if it was already read in that block, else None
+        with self._lock:
+            return self._count if self._count_block == block else None
+
+    def _store_count(self, block, count):
+        with self._lock:
+            if self._count_block is None or block >= self._count_block:
+                self._count_block, self._count = block, count
+
+    def read_jobs(self, chain_job_ids):
+        # Returns {chain_job_id: JobRecord}; ids out of range or unreadable are left out
+        chain_job_ids = list(dict.fromkeys(chain_job_ids))
+        if not chain_job_ids:
+            return {}
+        if self.batching:
+            try:
+                return self._read_batched(chain_job_ids)
+            except BatchUnsupported as e:
+                log(f"RPC endpoint rejected batch request ({e}); using individual calls", "WARN")
+                self.batching = False
+            except (requests.RequestException, ValueError) as e:
+                log(f"Batched job read failed, retrying with individual calls: {e}", "WARN")
+        return self._read_single(chain_job_ids)
+
+    def read_job(self, chain_job_id):
+        return self.read_jobs([chain_job_id]).get(chain_job_id)
+
+    def _call(self, data):
+        return {"to": self.contract.address, "data": data}
+
+    def _read_batched(self, chain_job_ids):
+        calls = [("eth_blockNumber", []), ("eth_call", [self._call(self._job_count_data), "latest"])]
+        for chain_job_id in chain_job_ids:
+            data = self._jobs_selector + self.web3.codec.encode(["uint256"], [chain_job_id])
+            calls.append(("eth_call", [self._call(self.web3.to_hex(data)), "latest"]))
+        responses = self._batch(calls)
+        if "result" not in responses[0] or "result" not in responses[1]:
+            raise ValueError(f"jobCount/blockNumber failed: {responses[0]} {responses[1]}")
+        block = int(responses[0]["result"], 16)
+        count = int(responses[1]["result"], 16)
+        self._store_count(block, count)
+        records = {}
+        for chain_job_id, resp in zip(chain_job_ids, responses[2:]):
+            if not 0 <= chain_job_id < count:
+                continue
+            if "result" not in resp:
+                log(f"On-chain fetch failed for on-chain idx {chain_job_id}: {resp.get('error')}", "WARN")
+                continue
+            values = self.web3.codec.decode(self._jobs_types, bytes.fromhex(resp["result"][2:]))
+            records[chain_job_id] = JobRecord(*values)
+        return records
+
+    def _batch(self, calls):
+        payload = [{"jsonrpc": "2.0", "id": i, "method": m, "params": p} for i, (m, p) in enumerate(calls)]
+        started = time.time()
+        ok = False
+        try:
+            r = self.session.post(self.rpc_url, json=payload, timeout=self.timeout)
+            r.raise_for_status()
+            body = r.json()
+            ok = isinstance(body, list)
+        finally:
+            METRICS.record_call("rpc", "batch", time.time() - started, ok)
+        if not isinstance(body, list):
+            raise BatchUnsupported(body.get("error") if isinstance(body, dict) else body)
+        by_id = {item.get("id"): item for item in body}
+        return [by_id.get(i, {"error": "missing response"}) for i in range(len(calls))]
+
+    def _read_single(self, chain_job_ids):
+        block = self.web3.eth.block_number
+        count = self.cached_job_count(block)
+        if count is None:
+            count = self.contract.functions.jobCount().call()
+            self._store_count(block, count)
+        records = {}
+        for chain_job_id in chain_job_ids:
+            if not 0 <= chain_job_id < count:
+                continue
+            try:
+                records[chain_job_id] = JobRecord(*self.contract.functions.jobs(chain_job_id).call())
+            except Exception as e:
+                log(f"On-chain fetch failed for on-chain idx {chain_job_id}: {e}", "WARN")
+        return records
@@ -0,0 +1,448 @@
+import fcntl
+import hashlib
+import os
+import shutil
+import threading
+import time
+
+from algolions_node.util import log
+
+FICLONE = 0x40049409  # linux/fs.h, copy-on-write clone on btrfs/xfs/overlayfs-on-xfs
+
+_B58 = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+_B32 = "abcdefghijklmnopqrstuvwxyz234567"
+
+CODEC_RAW = 0x55
+CODEC_DAG_PB = 0x70
+MH_IDENTITY = 0x00
+MH_SHA2_256 = 0x12
+UNIXFS_RAW = 0
+UNIXFS_FILE = 2
+CARV2_HEADER = b"\xa1gversion\x02"  # dag-cbor {"version": 2}
+MAX_CAR_SECTION = 4 * 1024 * 1024  # blocks are at most 1-2MB in practice
+
+
+class CarError(ValueError):
+    pass
+
+
+# --- CID integrity checks ---
+
+def _b58decode(s):
+    n = 0
+    for ch in s:
+        n = n * 58 + _B58.index(ch)
+    body = n.to_bytes((n.bit_length() + 7) // 8, "big")
+    return b"\0" * (len(s) - len(s.lstrip("1"))) + body
+
+
+def _b32decode(s):
+    bits = nbits = 0
+    out = bytearray()
+    for ch in s.lower():
+        bits = (bits << 5) | _B32.index(ch)
+        nbits += 5
+        if nbits >= 8:
+            nbits -= 8
+            out.append((bits >> nbits) & 0xFF)
+    return bytes(out)
+
+
+def _read_varint(buf, pos):
+    value = shift = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        value |= (b & 0x7F) << shift
+        if not b & 0x80:
+            return value, pos
+        shift += 7
+
+
+def _varint(n):
+    out = bytearray()
+    while True:
+        b = n & 0x7F
+        n >>= 7
+        if n:
+            out.append(b | 0x80)
+        else:
+            out.append(b)
+            return bytes(out)
+
+
+def parse_cid(cid):
+    # Returns (codec, hash_fn, digest) for CIDv0 ("Qm...") and base32 CIDv1 ("b...")
+    if cid.startswith("Qm") and len(cid) == 46:
+        mh = _b58decode(cid)
+        return CODEC_DAG_PB, mh[0], mh[2:]
+    if cid.startswith("b"):
+        buf = _b32decode(cid[1:])
+        version, pos = _read_varint(buf, 0)
+        if version != 1:
+            raise ValueError(f"Unsupported CID version {version}")
+        codec, pos = _read_varint(buf, pos)
+        hash_fn, pos = _read_varint(buf, pos)
+        length, pos = _read_varint(buf, pos)
+        return codec, hash_fn, buf[pos:pos + length]
+    raise ValueError(f"Unsupported CID encoding: {cid}")
+
+
+def _unixfs_leaf_digest(content):
+    # sha256 of the dag-pb node `ipfs add` produces for a file that fits in one chunk
+    data = b"\x08\x02"
+    if content:
+        data += b"\x12" + _varint(len(content)) + content
+    data += b"\x18" + _varint(len(content))
+    return hashlib.sha256(b"\x0a" + _varint(len(data)) + data).digest()
+
+
+def verify_cid(cid, path, max_leaf_size=256 * 1024):
+    # True/False when the content can be checked against the CID, None when it can't
+    # (multi-block dag-pb files or hash functions other than sha2-256).
+    try:
+        codec, hash_fn, digest = parse_cid(cid)
+    except (ValueError, IndexError):
+        return None
+    if hash_fn != MH_SHA2_256:
+        return None
+    if codec == CODEC_RAW:
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                h.update(chunk)
+        return h.digest() == digest
+    if codec == CODEC_DAG_PB and os.path.getsize(path) <= max_leaf_size:
+        with open(path, "rb") as f:
+            if _unixfs_leaf_digest(f.read()) == digest:
+                return True
+        # Small files may still have been added with a non-default chunker/layout
+        return None
+    return None
+
+
+def cid_codec(cid):
+    try:
+        return parse_cid(cid)[0]
+    except (ValueError, IndexError):
+        return None
+
+
+# --- CAR files (a gateway's ?format=car response) ---
+
+def _read_cid_bytes(buf, pos):
+    # Binary CID at buf[pos:] -> (codec, hash_fn, digest, end)
+    if buf[pos] == MH_SHA2_256 and buf[pos + 1] == 0x20:
+        # CIDv0 is a bare sha2-256 multihash
+        return CODEC_DAG_PB, MH_SHA2_256, bytes(buf[pos + 2:pos + 34]), pos + 34
+    version, pos = _read_varint(buf, pos)
+    if version != 1:
+        raise CarError(f"unsupported CID version {version}")
+    codec, pos = _read_varint(buf, pos)
+    hash_fn, pos = _read_varint(buf, pos)
+    length, pos = _read_varint(buf, pos)
+    return codec, hash_fn, bytes(buf[pos:pos + length]), pos + length
+
+
+def _pb_fields(buf):
+    # (field number, value) pairs of a protobuf message; varints as ints, the rest as bytes
+    pos = 0
+    while pos < len(buf):
+        key, pos = _read_varint(buf, pos)
+        field, wire = key >> 3, key & 7
+        if wire == 0:
+            value, pos = _read_varint(buf, pos)
+        elif wire == 2:
+            length, pos = _read_varint(buf, pos)
+            value, pos = buf[pos:pos + length], pos + length
+        else:
+            raise CarError(f"unexpected protobuf wire type {wire}")
+        yield field, value
+
+
+def _read_stream_varint(f):
+    # Next varint in the file, or None at a clean end of file
+    value = shift = 0
+    while True:
+        b = f.read(1)
+        if not b:
+            if shift:
+                raise CarError("truncated CAR")
+            return None
+        value |= (b[0] & 0x7F) << shift
+        if not b[0] & 0x80:
+            return value
+        shift += 7
+
+
+def _index_car(f):
+    # {(hash_fn, digest): (codec, offset, length)} for every block of a CARv1, each block
+    # checked against its CID on the way
+    header_length = _read_stream_varint(f)
+    if header_length is None:
+        raise CarError("empty CAR")
+    if f.read(header_length) == CARV2_HEADER:
+        raise CarError("CARv2 is not supported")
+    blocks = {}
+    while True:
+        length = _read_stream_varint(f)
+        if length is None:
+            return blocks
+        if length > MAX_CAR_SECTION:
+            raise CarError(f"CAR section of {length} bytes")
+        start = f.tell()
+        section = f.read(length)
+        if len(section) != length:
+            raise CarError("truncated CAR")
+        codec, hash_fn, digest, pos = _read_cid_bytes(section, 0)
+        data = section[pos:]
+        if hash_fn == MH_SHA2_256:
+            ok = hashlib.sha256(data).digest() == digest
+        elif hash_fn == MH_IDENTITY:
+            ok = data == digest
+        else:
+            raise CarError(f"unsupported hash function {hash_fn:#x}")
+        if not ok:
+            raise CarError("block does not match its CID")
+        blocks[(hash_fn, digest)] = (codec, start + pos, len(data))
+
+
+def unpack_car(car_path, cid, out_path):
+    # Writes the UnixFS file `cid` names from a CARv1 to out_path. Every block is checked
+    # against its CID and the file is put together by walking the DAG from the root, so
+    # the result is verified however the file was chunked. Raises CarError if the CAR is
+    # corrupt, incomplete or holds something other than a plain file.
+    try:
+        root = parse_cid(cid)
+        with open(car_path, "rb") as car, open(out_path, "wb") as out:
+            blocks = _index_car(car)
+            stack = [root]
+            while stack:
+                codec, hash_fn, digest = stack.pop()
+                if hash_fn == MH_IDENTITY:
+                    data = digest  # inlined block
+                else:
+                    entry = blocks.get((hash_fn, digest))
+                    if entry is None or entry[0] != codec:
+                        raise CarError("CAR is missing a block")
+                    car.seek(entry[1])
+                    data = car.read(entry[2])
+                if codec == CODEC_RAW:
+                    out.write(data)
+                    continue
+                if codec != CODEC_DAG_PB:
+                    raise CarError(f"unsupported codec {codec:#x}")
+                links, unixfs = [], b""
+                for field, value in _pb_fields(data):
+                    if field == 2:
+                        link = next((v for f, v in _pb_fields(value) if f == 1), None)
+                        if link is None:
+                            raise CarError("dag-pb link without a hash")
+                        links.append(_read_cid_bytes(link, 0)[:3])
+                    elif field == 1:
+                        unixfs = value
+                node_type, content = None, b""
+                for field, value in _pb_fields(unixfs):
+                    if field == 1:
+                        node_type = value
+                    elif field == 2:
+                        content = value
+                if node_type not in (UNIXFS_RAW, UNIXFS_FILE):
+                    raise CarError(f"not a UnixFS file (node type {node_type})")
+                # A file node's own data comes before its children's, in link order
+                out.write(content)
+                stack.extend(reversed(links))
+    except IndexError:
+        raise CarError("malformed CAR")
+
+
+# --- Placement into the sandbox ---
+
+def place_file(src, dest):
+    # Gives a job its own copy: a reflink where the filesystem supports it, else a plain
+    # copy. Never a hard link: the model runs as root, so a read-only mode would not stop
+    # it writing through to the cached object other jobs share.
+    try:
+        with open(src, "rb") as s, open(dest, "wb") as d:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+        return "reflink"
+    except OSError:
+        try:
+            os.remove(dest)
+        except OSError:
+            pass
+    shutil.copyfile(src, dest)
+    return "copy"
+
+
+class CacheEntry:
+    def __init__(self, path, size, mtime_ns, last_used):
+        self.path = path
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.last_used = last_used
+
+
+# Persistent content-addressed store for IPFS inputs, keyed by CID and bounded by
+# total size with LRU eviction. Access times are written back to the object files
+# so LRU order survives restarts.
+class CidCache:
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.objects_dir = os.path.join(root, "objects")
+        self.tmp_dir = os.path.join(root, "tmp")
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._cid_locks = {}
+        self._entries = {}
+        self._total = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.corrupt = 0
+        self.unverified = 0  # fetches that could not be checked against the CID, so not cached
+        self._load()
+
+    def _load(self):
+        for name in os.listdir(self.tmp_dir):
+            os.remove(os.path.join(self.tmp_dir, name))
+        for cid in os.listdir(self.objects_dir):
+            path = os.path.join(self.objects_dir, cid)
+            st = os.stat(path)
+            self._entries[cid] = CacheEntry(path, st.st_size, st.st_mtime_ns, st.st_atime)
+            self._total += st.st_size
+        self._evict()
+
+    def _cid_lock(self, cid):
+        with self._lock:
+            return self._cid_locks.setdefault(cid, threading.Lock())
+
+    def __contains__(self, cid):
+        with self._lock:
+            return cid in self._entries
+
+    def size_of(self, cid):
+        with self._lock:
+            entry = self._entries.get(cid)
+            return entry.size if entry else None
+
+    def recent(self, limit):
+        # Most recently used CIDs first
+        with self._lock:
+            entries = sorted(self._entries.items(), key=lambda item: item[1].last_used, reverse=True)
+        return [cid for cid, _ in entries[:limit]]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "corrupt": self.corrupt,
+                "unverified": self.unverified,
+            }
+
+    def fetch(self, cid, dest, fetcher, car_fetcher=None):
+        # Places the content of `cid` at `dest`, calling fetcher(cid, path) -> bool on a miss.
+        # dag-pb CIDs are tried through car_fetcher(cid, path) -> bool first, which checks the
+        # content block by block. Only verified content is cached; anything else goes to
+        # this job's `dest` alone, so one bad gateway response cannot reach later jobs.
+        # Concurrent jobs asking for the same CID share one download.
+        with self._cid_lock(cid):
+            if self._place_cached(cid, dest):
+                return True
+            with self._lock:
+                self.misses += 1
+            tmp = os.path.join(self.tmp_dir, f"{cid}.{threading.get_ident()}")
+            try:
+                verified = None
+                if car_fetcher is not None and cid_codec(cid) == CODEC_DAG_PB:
+                    verified = car_fetcher(cid, tmp) or None
+                if verified is None:
+                    if not fetcher(cid, tmp):
+                        return False
+                    verified = verify_cid(cid, tmp)
+                if verified is False:
+                    log(f"IPFS content for {cid} does not match its CID, discarding", "ERR")
+                    with self._lock:
+                        self.corrupt += 1
+                    return False
+                if verified is None:
+                    with self._lock:
+                        self.unverified += 1
+                    shutil.move(tmp, dest)
+                    return True
+                self._insert(cid, tmp)
+            finally:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+            return self._place_cached(cid, dest, count_hit=False)
+
+    def _place_cached(self, cid, dest, count_hit=True):
+        with self._lock:
+            entry = self._entries.get(cid)
+        if entry is None:
+            return False
+        try:
+            st = os.stat(entry.path)
+            if st.st_size != entry.size or st.st_mtime_ns != entry.mtime_ns:
+                raise OSError("cached object was modified")
+            place_file(entry.path, dest)
+        except OSError as e:
+            log(f"Dropping cached {cid}: {e}", "WARN")
+            with self._lock:
+                self.corrupt += 1
+            self._remove(cid)
+            return False
+        now = time.time()
+        try:
+            os.utime(entry.path, ns=(int(now * 1e9), entry.mtime_ns))
+        except OSError:
+            pass
+        with self._lock:
+            entry.last_used = now
+            if count_hit:
+                self.hits += 1
+        return True
+
+    def _insert(self, cid, tmp):
+        path = os.path.join(self.objects_dir, cid)
+        os.chmod(tmp, 0o444)
+        os.replace(tmp, path)
+        st = os.stat(path)
+        with self._lock:
+            old = self._entries.pop(cid, None)
+            if old:
+                self._total -= old.size
+            self._entries[cid] = CacheEntry(path, st.st_size, st.st_mtime_ns, time.time())
+            self._total += st.st_size
+        self._evict(keep=cid)
+
+    def _remove(self, cid):
+        with self._lock:
+            entry = self._entries.pop(cid, None)
+            if entry is None:
+                return
+            self._total -= entry.size
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+
+    def _evict(self, keep=None):
+        # Jobs holding reflinks keep their copy; only the cache's name goes away
+        while True:
+            with self._lock:
+                if self._total <= self.max_bytes:
+                    return
+                victims = [c for c in self._entries if c != keep]
+                if not victims:
+                    return
+                cid = min(victims, key=lambda c: self._entries[c].last_used)
+                self.evictions += 1
+            self._remove(cid)
@@ -0,0 +1,137 @@
+import json
+import os
+import threading
+
+from algolions_node.util import log, save_json_atomic
+
+JOB_EVENTS = ("JobSubmitted", "JobClaimed", "JobCompleted", "JobFailed")
+
+
+def event_topic(web3, contract, name):
+    abi = next(x for x in contract.abi if x.get("type") == "event" and x["name"] == name)
+    signature = f"{name}({','.join(i['type'] for i in abi['inputs'])})"
+    return web3.keccak(text=signature)
+
+
+# Follows JobSubmitted/JobClaimed/JobCompleted/JobFailed logs and keeps an index of open
+# (submitted, unclaimed) jobs. Blocks deeper than `confirmations` are applied to the
+# durable index and the cursor is persisted; the unconfirmed tail is re-read every poll
+# and layered on top, so new jobs show up within a block and a reorg simply drops them.
+class ChainJobFeed:
+    def __init__(self, web3, contract, cursor_path, confirmations=3, start_block=None,
+                 lookback_blocks=5000, max_range=2000):
+        self.web3 = web3
+        self.contract = contract
+        self.cursor_path = cursor_path
+        self.confirmations = confirmations
+        self.max_range = max_range
+        self._lock = threading.Lock()
+        self._topics = {bytes(event_topic(web3, contract, name)): name for name in JOB_EVENTS}
+        self._open = {}
+        self._cursor = None
+        if os.path.exists(cursor_path):
+            with open(cursor_path) as f:
+                state = json.load(f)
+            self._cursor = state["block"]
+            self._open = {int(k): v for k, v in state.get("open", {}).items()}
+        elif start_block is not None:
+            self._cursor = start_block - 1
+        else:
+            self._cursor = max(web3.eth.block_number - lookback_blocks, -1)
+
+    @property
+    def cursor(self):
+        return self._cursor
+
+    def _get_logs(self, from_block, to_block):
+        logs = self.web3.eth.get_logs({
+            "address": self.contract.address,
+            "fromBlock": from_block,
+            "toBlock": to_block,
+            "topics": [[self.web3.to_hex(t) for t in self._topics]],
+        })
+        events = []
+        for entry in logs:
+            name = self._topics.get(bytes(entry["topics"][0]))
+            if name:
+                events.append(self.contract.events[name]().process_log(entry))
+        events.sort(key=lambda e: (e["blockNumber"], e["logIndex"]))
+        return events
+
+    @staticmethod
+    def _apply(index, event):
+        args = event["args"]
+        chain_job_id = args["jobId"]
+        if event["event"] == "JobSubmitted":
+            index[chain_job_id] = {
+                "chain_job_id": chain_job_id,
+                "model_cid": args["modelCID"],
+                "dataset_cid": args["dataCID"],
+                "paid": args["paid"],
+                "block": event["blockNumber"],
+            }
+        else:
+            index.pop(chain_job_id, None)
+
+    def poll(self):
+        # Returns the open jobs (confirmed + tentative), oldest first
+        head = self.web3.eth.block_number
+        confirmed_to = head - self.confirmations
+        with self._lock:
+            while self._cursor < confirmed_to:
+                to_block = min(self._cursor + self.max_range, confirmed_to)
+                for event in self._get_logs(self._cursor + 1, to_block):
+                    self._apply(self._open, event)
+                self._cursor = to_block
+                save_json_atomic(self.cursor_path, {"block": self._cursor, "open": self._open})
+            view = dict(self._open)
+        if head > confirmed_to:
+            for event in self._get_logs(max(confirmed_to + 1, 0), head):
+                self._apply(view, event)
+        return [view[k] for k in sorted(view)]
+
+    def mark_closed(self, chain_job_id):
+        # Lets callers drop a job they know is gone before its event is confirmed
+        with self._lock:
+            self._open.pop(chain_job_id, None)
+
+    def open_count(self):
+        with self._lock:
+            return len(self._open)
+
+
+# Events say *when* a job appears; the backend listing supplies its backend job_id.
+# The listing is fetched only when the feed reports a chain job we have no id for yet,
+# or every `fallback_interval` seconds to pick up anything the feed missed.
+class EventJobSource:
+    def __init__(self, feed, list_backend_jobs, fallback_interval=60):
+        self.feed = feed
+        self.list_backend_jobs = list_backend_jobs
+        self.fallback_interval = fallback_interval
+        self._backend = {}
+        self._looked_up = set()
+        self._last_listing = 0.0
+
+    def _refresh(self, now):
+        self._last_listing = now
+        jobs = self.list_backend_jobs()
+        self._backend = {j["chain_job_id"]: j for j in jobs if j.get("chain_job_id") is not None}
+        return jobs
+
+    def next_jobs(self, now):
+        try:
+            open_jobs = self.feed.poll()
+        except Exception as e:
+            log(f"Job event feed error, using backend listing: {e}", "WARN")
+            return self._refresh(now)
+
+        open_ids = [j["chain_job_id"] for j in open_jobs]
+        unknown = [i for i in open_ids if i not in self._backend and i not in self._looked_up]
+        if unknown or now - self._last_listing >= self.fallback_interval:
+            self._looked_up.update(unknown)
+            fallback = now - self._last_listing >= self.fallback_interval
+            jobs = self._refresh(now)
+            if fallback:
+                return jobs
+        self._looked_up.intersection_update(open_ids)
+        return [self._backend[i] for i in open_ids if i in self._backend]
@@ -0,0 +1,311 @@
+import hashlib
+import json
+import os
+import select
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+from algolions_node.sandbox import LIMIT_SIGNALS, JobUsage
+from algolions_node.util import log
+
+MODEL_TIMEOUT = 900  # 15 min
+OUTPUT_SIZE_LIMIT = 100 * 1024 * 1024  # 100 MB
+HASH_CHUNK = 1024 * 1024
+
+# Runs as `python -c LIMITED_EXEC <limits json> <argv...>`: sets the rlimits, then execs the
+# model in the same process. The node has many threads, so no Python code may run between
+# fork and exec (preexec_fn) in a child of the node itself.
+LIMITED_EXEC = ("import json, os, sys; from algolions_node.sandbox import apply_rlimits; "
+                "apply_rlimits(json.loads(sys.argv[1])); os.execvp(sys.argv[2], sys.argv[2:])")
+
+
+class ExecResult:
+    def __init__(self, returncode, timed_out=False, output_exceeded=False, wall_time=0.0, usage=None):
+        self.returncode = returncode
+        self.timed_out = timed_out
+        self.output_exceeded = output_exceeded
+        self.wall_time = wall_time
+        self.usage = usage or JobUsage()
+
+    @property
+    def limit_exceeded(self):
+        # Name of the per-job resource limit that killed the model, if any
+        if self.usage.oom_killed:
+            return "memory limit"
+        return LIMIT_SIGNALS.get(self.returncode)
+
+    @property
+    def ok(self):
+        return self.returncode == 0 and not self.timed_out and not self.output_exceeded
+
+
+class WarmProcessError(Exception):
+    pass
+
+
+class Zygote:
+    # One warm interpreter (algolions_node.zygote) that runs a single job at a time
+    def __init__(self, preload):
+        self.proc = subprocess.Popen(
+            [sys.executable, "-m", "algolions_node.zygote", *preload],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+        self._buf = b""
+
+    def alive(self):
+        return self.proc.poll() is None
+
+    def read_message(self, timeout=None):
+        # Returns the next JSON line, or None if nothing arrived within `timeout`
+        deadline = None if timeout is None else time.time() + timeout
+        fd = self.proc.stdout.fileno()
+        while b"\n" not in self._buf:
+            remaining = None if deadline is None else max(deadline - time.time(), 0)
+            ready, _, _ = select.select([fd], [], [], remaining)
+            if not ready:
+                return None
+            chunk = os.read(fd, 4096)
+            if not chunk:
+                raise WarmProcessError("warm executor exited")
+            self._buf += chunk
+        line, self._buf = self._buf.split(b"\n", 1)
+        return json.loads(line)
+
+    def start_job(self, argv, limits):
+        self.proc.stdin.write((json.dumps({"argv": argv, "limits": limits}) + "\n").encode())
+        self.proc.stdin.flush()
+        msg = self.read_message(timeout=10)
+        if not msg or "pid" not in msg:
+            raise WarmProcessError(f"warm executor did not start the job: {msg}")
+        return msg["pid"]
+
+    def close(self):
+        try:
+            os.killpg(self.proc.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+        self.proc.wait()
+
+
+class ColdChild:
+    # `python model.py ...` subprocess reaped with wait4() so its rusage is kept
+    def __init__(self, argv, limits):
+        # Limits are set by a wrapper that then execs the model, so it never runs without them
+        command = ["python", *argv]
+        if limits:
+            command = [sys.executable, "-c", LIMITED_EXEC, json.dumps(limits), *command]
+        self.proc = subprocess.Popen(
+            command,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+        self.pid = self.proc.pid
+        self.returncode = None
+        self.usage = JobUsage()
+
+    def wait(self, timeout=None):
+        deadline = None if timeout is None else time.time() + timeout
+        while self.returncode is None:
+            pid, status, ru = os.wait4(self.pid, os.WNOHANG)
+            if pid:
+                self.returncode = os.waitstatus_to_exitcode(status)
+                self.proc.returncode = self.returncode
+                self.usage = JobUsage.from_rusage(ru)
+                break
+            if deadline is not None and time.time() >= deadline:
+                raise subprocess.TimeoutExpired("model.py", timeout)
+            time.sleep(0.05)
+        return self.returncode
+
+    def kill(self):
+        self.proc.kill()
+
+
+class WarmChild:
+    # Popen-like handle for a job forked by a zygote: exposes pid, wait(), kill(), returncode
+    def __init__(self, pool, zygote, pid):
+        self.pool = pool
+        self.zygote = zygote
+        self.pid = pid
+        self.returncode = None
+        self.usage = JobUsage()
+
+    def wait(self, timeout=None):
+        if self.returncode is not None:
+            return self.returncode
+        try:
+            msg = self.zygote.read_message(timeout)
+        except (WarmProcessError, ValueError) as e:
+            log(f"Warm executor lost while running pid {self.pid}: {e}", "WARN")
+            self.returncode = -signal.SIGKILL
+            self.pool.release(self.zygote, broken=True)
+            return self.returncode
+        if msg is None:
+            raise subprocess.TimeoutExpired("model.py", timeout)
+        self.returncode = msg["exit"]
+        if msg.get("usage"):
+            self.usage = JobUsage(**msg["usage"])
+        self.pool.release(self.zygote)
+        return self.returncode
+
+    def kill(self):
+        try:
+            os.kill(self.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+
+# Pool of pre-warmed zygotes with the ML stack already imported. Each job forks a
+# fresh child from an idle zygote; when none is ready the caller falls back to a
+# cold `python model.py` subprocess.
+class WarmPool:
+    def __init__(self, size, preload=None, ready_timeout=180):
+        self.size = size
+        self.preload = preload or []
+        self.ready_timeout = ready_timeout
+        self._idle = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def start(self):
+        for _ in range(self.size):
+            self._launch()
+
+    def _launch(self):
+        threading.Thread(target=self._warm_up, name="warm-executor", daemon=True).start()
+
+    def _warm_up(self):
+        try:
+            zygote = Zygote(self.preload)
+            msg = zygote.read_message(timeout=self.ready_timeout)
+        except (OSError, WarmProcessError, ValueError) as e:
+            log(f"Warm executor failed to start: {e}", "WARN")
+            return
+        if not msg or not msg.get("ready"):
+            log("Warm executor did not become ready; jobs will use cold starts", "WARN")
+            zygote.close()
+            return
+        if msg.get("failed"):
+            log(f"Warm executor could not preload: {', '.join(msg['failed'])}", "WARN")
+        with self._lock:
+            if self._closed:
+                zygote.close()
+                return
+            self._idle.append(zygote)
+
+    def ready_count(self):
+        with self._lock:
+            return len(self._idle)
+
+    def spawn(self, argv, limits=None):
+        # Returns a WarmChild, or None when no warm zygote is available
+        while True:
+            with self._lock:
+                if not self._idle:
+                    return None
+                zygote = self._idle.pop()
+            if not zygote.alive():
+                zygote.close()
+                self._launch()
+                continue
+            try:
+                return WarmChild(self, zygote, zygote.start_job(argv, limits or {}))
+            except (OSError, WarmProcessError, ValueError) as e:
+                log(f"Warm executor failed to start job, replacing it: {e}", "WARN")
+                self.release(zygote, broken=True)
+
+    def release(self, zygote, broken=False):
+        if broken or not zygote.alive():
+            zygote.close()
+            if not self._closed:
+                self._launch()
+            return
+        with self._lock:
+            if self._closed:
+                zygote.close()
+            else:
+                self._idle.append(zygote)
+
+    def stop(self):
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for zygote in idle:
+            zygote.close()
+
+
+def _kill_group(proc):
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        proc.kill()
+    proc.wait()
+
+
+def run_model(model_path, data_path, output_path, timeout=MODEL_TIMEOUT,
+              output_limit=OUTPUT_SIZE_LIMIT, poll_interval=0.5, pool=None,
+              limits=None, cgroups=None, cgroup_name=None):
+    # Runs `python model.py data.csv output` (forked from a warm pool when one is ready)
+    # under the given rlimits/cgroup, and watches the output file while it runs, killing
+    # the whole process group as soon as the output crosses output_limit.
+    started = time.time()
+    argv = [model_path, data_path, output_path]
+    proc = pool.spawn(argv, limits) if pool is not None else None
+    if proc is None:
+        proc = ColdChild(argv, limits)
+    cgroup = cgroups.attach(cgroup_name or f"pid-{proc.pid}", proc.pid, limits or {}) if cgroups else None
+
+    deadline = started + timeout
+    timed_out = exceeded = False
+    while True:
+        try:
+            proc.wait(timeout=poll_interval)
+            break
+        except subprocess.TimeoutExpired:
+            pass
+        try:
+            if os.path.getsize(output_path) > output_limit:
+                exceeded = True
+                _kill_group(proc)
+                break
+        except OSError:
+            pass
+        if time.time() > deadline:
+            timed_out = True
+            _kill_group(proc)
+            break
+    # Hitting RLIMIT_FSIZE on the output file is the same failure as the size watch
+    if not exceeded and os.path.exists(output_path):
+        exceeded = os.path.getsize(output_path) > output_limit
+
+    usage = proc.usage
+    if cgroup:
+        group_usage = cgroups.collect(cgroup)
+        # cgroup figures include grandchildren; rusage fills whatever the kernel lacks
+        usage = JobUsage(
+            peak_rss=group_usage.peak_rss or usage.peak_rss,
+            cpu_seconds=group_usage.cpu_seconds or usage.cpu_seconds,
+            io_read_bytes=group_usage.io_read_bytes or usage.io_read_bytes,
+            io_write_bytes=group_usage.io_write_bytes or usage.io_write_bytes,
+            oom_killed=group_usage.oom_killed,
+        )
+    return ExecResult(proc.returncode, timed_out=timed_out, output_exceeded=exceeded,
+                      wall_time=time.time() - started, usage=usage)
+
+
+def hash_file(path):
+    # Single streaming pass; returns (sha256 hex, size) without loading the file into memory
+    h = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            h.update(chunk)
+            size += len(chunk)
+    return h.hexdigest(), size
@@ -0,0 +1,138 @@
+import threading
+import time
+
+from web3.exceptions import ContractLogicError
+
+from algolions_node.metrics import METRICS, labelled
+from algolions_node.util import log
+
+GWEI = 10 ** 9
+
+
+# Fee and gas-limit policy for every transaction the node sends.
+#
+# Fee data (base fee + suggested tip on EIP-1559 chains, gasPrice elsewhere) is read once
+# per block and reused by every tx sent in that block. Gas limits come from an estimate of
+# each call, raised to the most the method has ever used (learned from receipts). Methods
+# whose cost depends on contract state or arguments (completeJob credits a reward balance,
+# failJob stores the reason string) also keep their old fixed limit as a floor.
+# "Urgent" methods (claimJob by default) pay a higher tip, since claim races are decided
+# by inclusion order.
+class FeeEngine:
+    def __init__(self, web3, mode="auto", priority_fee_gwei=None, max_fee_multiplier=2.0,
+                 urgent_methods=("claimJob",), urgent_tip_multiplier=2.0, urgent_tip_gwei=None,
+                 gas_margin=1.2, block_ttl=2.0, variable_gas_methods=("completeJob", "failJob")):
+        self.web3 = web3
+        self.mode = mode  # "auto" uses EIP-1559 when blocks carry a base fee, "legacy" never does
+        self.priority_fee = int(priority_fee_gwei * GWEI) if priority_fee_gwei is not None else None
+        self.max_fee_multiplier = max_fee_multiplier
+        self.urgent_methods = set(urgent_methods)
+        self.urgent_tip_multiplier = urgent_tip_multiplier
+        self.urgent_tip = int(urgent_tip_gwei * GWEI) if urgent_tip_gwei is not None else None
+        self.gas_margin = gas_margin
+        self.variable_gas_methods = set(variable_gas_methods)
+        self.block_ttl = block_ttl  # seconds before checking for a new block
+        self._lock = threading.Lock()
+        self._block = None
+        self._checked_at = 0.0
+        self._fee_data = None
+        self._gas = {}  # method -> highest gas seen (estimate or receipt)
+        METRICS.gauge("gas_limit_estimate", lambda: labelled("method", self.gas_estimates()))
+        METRICS.gauge("fee_tip_wei", lambda: (self._fee_data or {}).get("tip", 0))
+        METRICS.gauge("fee_base_wei", lambda: (self._fee_data or {}).get("base_fee", 0))
+
+    # --- Fee data ---
+
+    def _current(self):
+        with self._lock:
+            now = time.time()
+            if self._fee_data is not None and now - self._checked_at < self.block_ttl:
+                return self._fee_data
+            block = self.web3.eth.get_block("latest")
+            self._checked_at = now
+            if self._fee_data is not None and block["number"] == self._block:
+                return self._fee_data
+            base_fee = block.get("baseFeePerGas")
+            if base_fee is None or self.mode == "legacy":
+                data = {"gas_price": self.web3.eth.gas_price, "base_fee": base_fee or 0}
+            else:
+                data = {"base_fee": base_fee, "tip": self._suggested_tip()}
+            self._block, self._fee_data = block["number"], data
+            return data
+
+    def _suggested_tip(self):
+        if self.priority_fee is not None:
+            return self.priority_fee
+        try:
+            return self.web3.eth.max_priority_fee
+        except Exception as e:
+            log(f"Could not read priority fee suggestion ({e}); using 1 gwei", "WARN")
+            return GWEI
+
+    def fee_fields(self, method):
+        # Fee fields for a transaction calling `method`
+        data = self._current()
+        urgent = method in self.urgent_methods
+        if "gas_price" in data:
+            price = data["gas_price"]
+            if urgent:
+                # Only the part above the base fee is a tip; without a base fee that is all of it
+                base = min(data["base_fee"], price)
+                price = base + max(int((price - base) * self.urgent_tip_multiplier), self.urgent_tip or 0)
+            return {"gasPrice": price}
+        tip = data["tip"]
+        if urgent:
+            tip = max(int(tip * self.urgent_tip_multiplier), self.urgent_tip or 0)
+        return {
+            "maxPriorityFeePerGas": tip,
+            "maxFeePerGas": int(data["base_fee"] * self.max_fee_multiplier) + tip,
+        }
+
+    def bump(self, tx, factor):
+        # Replacement fees: at least `factor` times the old ones and no lower than current fees
+        current = self.fee_fields(None)
+        bumped = dict(tx)
+        for field in ("gasPrice", "maxPriorityFeePerGas", "maxFeePerGas"):
+            if field in tx:
+                bumped[field] = max(int(tx[field] * factor) + 1, current.get(field, 0))
+        if "maxFeePerGas" in bumped:
+            bumped["maxFeePerGas"] = max(bumped["maxFeePerGas"], bumped["maxPriorityFeePerGas"])
+        return bumped
+
+    def is_urgent(self, method):
+        return method in self.urgent_methods
+
+    # --- Gas limits ---
+
+    def gas_limit(self, fn, method, tx_params, fallback):
+        # Raises ContractLogicError if the call would revert (e.g. the job is already claimed).
+        # `tx_params` carries "from" and, to save a round trip, "chainId".
+        try:
+            estimate = fn.estimate_gas(tx_params)
+        except ContractLogicError:
+            raise
+        except Exception as e:
+            log(f"Gas estimate for {method} failed ({e}); using {fallback}", "WARN")
+            with self._lock:
+                return max(fallback, int(self._gas.get(method, 0) * self.gas_margin))
+        with self._lock:
+            highest = self._gas[method] = max(self._gas.get(method, 0), estimate)
+        limit = int(highest * self.gas_margin)
+        if method in self.variable_gas_methods:
+            limit = max(limit, fallback)
+        return limit
+
+    def record_receipt(self, method, receipt, gas_limit):
+        gas_used = receipt.get("gasUsed")
+        if not gas_used:
+            return
+        with self._lock:
+            self._gas[method] = max(self._gas.get(method, 0), gas_used)
+        if receipt.get("status", 1) == 0 and gas_used >= gas_limit:
+            log(f"{method} ran out of gas at limit {gas_limit}; raising its estimate", "WARN")
+            with self._lock:
+                self._gas[method] = int(gas_limit * self.gas_margin)
+
+    def gas_estimates(self):
+        with self._lock:
+            return dict(self._gas)
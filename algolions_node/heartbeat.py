@@ -0,0 +1,53 @@
+import threading
+import time
+
+from algolions_node.util import log
+
+
+# Posts the node's heartbeats from one long-lived thread over the shared backend session.
+# `payloads_fn()` is called on every tick and returns one payload per identity the process
+# serves, so each heartbeat carries the node's current capacity rather than what it
+# looked like at start-up.
+class Heartbeat:
+    def __init__(self, client, payloads_fn, interval=60, path="/api/network/heartbeat"):
+        self.client = client
+        self.payloads_fn = payloads_fn
+        self.interval = interval
+        self.path = path
+        self.sent = 0
+        self.failures = 0
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="heartbeat", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def beat(self):
+        ok = True
+        for payload in self.payloads_fn():
+            try:
+                self.client.post(self.path, json=payload, timeout=5, endpoint=self.path)
+                self.sent += 1
+            except Exception as e:
+                self.failures += 1
+                ok = False
+                log(f"Heartbeat for {payload.get('node_id')} failed: {e}", "WARN")
+        return ok
+
+    def _run(self):
+        # Ticks stay on a fixed schedule however long a post takes
+        next_at = time.monotonic()
+        while not self._stopped.is_set():
+            self.beat()
+            next_at += self.interval
+            delay = next_at - time.monotonic()
+            if delay < 0:
+                next_at, delay = time.monotonic(), 0
+            self._stopped.wait(delay)
@@ -0,0 +1,73 @@
+import threading
+
+# Per-identity keys. Listed identities inherit the shared ones from the top-level config;
+# a wallet's key and node id are never inherited.
+IDENTITY_KEYS = ("wallet_address", "private_key", "node_id", "country", "hardware", "paid_only", "max_in_flight")
+SHARED_KEYS = ("country", "hardware", "paid_only", "max_in_flight")
+
+
+def identity_settings(config):
+    # node_config.json either lists executor wallets under "identities" or has a single
+    # top-level wallet_address/private_key, as before
+    entries = config.get("identities")
+    if not entries:
+        entries = [{key: config.get(key) for key in IDENTITY_KEYS}]
+    settings, seen = [], set()
+    for entry in entries:
+        merged = {key: entry.get(key, config.get(key) if key in SHARED_KEYS else None) for key in IDENTITY_KEYS}
+        if not merged["wallet_address"] or not merged["private_key"]:
+            raise ValueError("every identity needs a wallet_address and a private_key")
+        wallet = merged["wallet_address"].lower()
+        if wallet in seen:
+            raise ValueError(f"wallet {merged['wallet_address']} is listed more than once")
+        seen.add(wallet)
+        merged["node_id"] = merged["node_id"] or merged["wallet_address"]
+        settings.append(merged)
+    return settings
+
+
+# One executor wallet served by this process. Each identity has its own TxManager (and so
+# its own nonce sequence), rewards service and claim policy; RPC, job discovery, the input
+# cache and the execution pool are shared by all of them.
+class Identity:
+    def __init__(self, settings, txm):
+        self.wallet = settings["wallet_address"]
+        self.node_id = settings["node_id"]
+        self.country = settings.get("country") or "N/A"
+        self.hardware = settings.get("hardware") or "N/A"
+        self.paid_only = bool(settings.get("paid_only"))
+        self.max_in_flight = settings.get("max_in_flight")  # None = no per-wallet cap
+        self.txm = txm
+        self.rewards = None
+        self._lock = threading.Lock()
+        self._in_flight = 0
+
+    def accepts(self, record):
+        if self.paid_only and not record.paid:
+            return False
+        return self.max_in_flight is None or self.in_flight() < self.max_in_flight
+
+    def in_flight(self):
+        with self._lock:
+            return self._in_flight
+
+    def acquire(self):
+        with self._lock:
+            self._in_flight += 1
+
+    def release(self):
+        with self._lock:
+            self._in_flight = max(self._in_flight - 1, 0)
+
+
+def assign_identity(identities, record):
+    # The least busy identity whose claim policy takes this job, or None
+    candidates = [i for i in identities if i.accepts(record)]
+    if not candidates:
+        return None
+    return min(candidates, key=lambda i: i.in_flight())
+
+
+def identity_for(identities, address):
+    address = (address or "").lower()
+    return next((i for i in identities if i.wallet.lower() == address), None)
@@ -0,0 +1,154 @@
+import os
+import threading
+import time
+
+import requests
+
+from algolions_node.cidcache import CarError, unpack_car
+from algolions_node.metrics import METRICS
+from algolions_node.util import log
+
+DEFAULT_GATEWAYS = ["https://ipfs.io"]
+CHUNK_SIZE = 64 * 1024
+CAR_MEDIA_TYPE = "application/vnd.ipld.car"
+
+
+class InputTooLarge(Exception):
+    pass
+
+
+# Streams IPFS content to disk through a list of HTTP gateways (public gateways or a
+# local node's gateway, e.g. http://127.0.0.1:8080). Gateways are tried fastest-first
+# based on recent throughput; an interrupted transfer resumes on the next attempt with
+# an HTTP Range request instead of starting over.
+class IpfsFetcher:
+    def __init__(self, gateways=None, session=None, connect_timeout=10, read_timeout=60,
+                 max_attempts=None, chunk_size=CHUNK_SIZE):
+        self.gateways = [g.rstrip("/") for g in (gateways or DEFAULT_GATEWAYS)]
+        self.session = session or requests.Session()
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_attempts = max_attempts or 2 * len(self.gateways)
+        self.chunk_size = chunk_size
+        self._lock = threading.Lock()
+        # Exponentially weighted bytes/sec per gateway; failures push a gateway to the back
+        self._score = {g: 0.0 for g in self.gateways}
+        self._no_car = set()  # gateways that answered ?format=car with something else
+
+    def _ranked(self):
+        with self._lock:
+            return sorted(self.gateways, key=lambda g: -self._score[g])
+
+    def _record(self, gateway, rate):
+        with self._lock:
+            self._score[gateway] = 0.7 * self._score[gateway] + 0.3 * rate
+
+    def content_length(self, cid, timeout=3):
+        # Size of the content per the fastest gateway's HEAD response, or None if unknown
+        gateway = self._ranked()[0]
+        try:
+            r = self.session.head(f"{gateway}/ipfs/{cid}", headers={"Accept-Encoding": "identity"},
+                                  timeout=timeout, allow_redirects=True)
+        except requests.RequestException:
+            return None
+        length = r.headers.get("Content-Length")
+        return int(length) if r.ok and length and length.isdigit() else None
+
+    def fetch(self, cid, out_path, max_bytes=None):
+        # Returns True on success, False when every gateway failed.
+        # Raises InputTooLarge as soon as the content is known to exceed max_bytes.
+        part = out_path + ".part"
+        if os.path.exists(part):
+            os.remove(part)
+        ranked = self._ranked()
+        for attempt in range(self.max_attempts):
+            gateway = ranked[attempt % len(ranked)]
+            try:
+                if self._fetch_from(gateway, cid, part, max_bytes):
+                    os.replace(part, out_path)
+                    return True
+            except InputTooLarge:
+                if os.path.exists(part):
+                    os.remove(part)
+                raise
+            except (requests.RequestException, OSError) as e:
+                have = os.path.getsize(part) if os.path.exists(part) else 0
+                log(f"IPFS fetch of {cid} from {gateway} interrupted at {have} bytes: {e}", "WARN")
+                self._record(gateway, -1.0)
+        log(f"IPFS download failed: {cid}", "WARN")
+        if os.path.exists(part):
+            os.remove(part)
+        return False
+
+    def fetch_car(self, cid, out_path, max_bytes=None):
+        # Fetches `cid` as a CAR (the gateway's verifiable format) and unpacks it to out_path,
+        # checking every block against its CID. Returns False when no gateway gave a usable
+        # CAR, so the caller can fall back to fetch(). Raises InputTooLarge like fetch().
+        car = out_path + ".car"
+        # Block CIDs and dag-pb framing add well under 1% on top of the file itself
+        car_limit = None if max_bytes is None else max_bytes + max_bytes // 16 + 1024 * 1024
+        try:
+            for gateway in self._ranked():
+                if gateway in self._no_car:
+                    continue
+                if os.path.exists(car):
+                    os.remove(car)
+                try:
+                    if not self._fetch_from(gateway, cid, car, car_limit, car=True):
+                        continue
+                    unpack_car(car, cid, out_path)
+                except (requests.RequestException, OSError, CarError) as e:
+                    log(f"IPFS CAR fetch of {cid} from {gateway} failed: {e}", "WARN")
+                    self._record(gateway, -1.0)
+                    continue
+                if max_bytes is not None and os.path.getsize(out_path) > max_bytes:
+                    os.remove(out_path)
+                    raise InputTooLarge(f"{cid} is over {max_bytes} bytes")
+                return True
+            return False
+        finally:
+            if os.path.exists(car):
+                os.remove(car)
+
+    def _fetch_from(self, gateway, cid, part, max_bytes, car=False):
+        offset = os.path.getsize(part) if os.path.exists(part) else 0
+        # Identity encoding keeps byte offsets and Content-Length meaningful for Range resumes
+        headers = {"Accept-Encoding": "identity"}
+        url = f"{gateway}/ipfs/{cid}"
+        if car:
+            headers["Accept"] = f"{CAR_MEDIA_TYPE}; version=1"
+            url += "?format=car"
+        elif offset:
+            headers["Range"] = f"bytes={offset}-"
+        started = time.time()
+        with self.session.get(url, headers=headers, stream=True, timeout=self.timeout) as r:
+            if car and r.ok and not r.headers.get("Content-Type", "").startswith(CAR_MEDIA_TYPE):
+                log(f"IPFS gateway {gateway} does not serve CARs", "WARN")
+                with self._lock:
+                    self._no_car.add(gateway)
+                return False
+            if r.status_code == 206:
+                mode = "ab"
+            elif r.ok:
+                # Gateway ignored the Range header; start this file over
+                mode, offset = "wb", 0
+            else:
+                log(f"IPFS gateway {gateway} returned {r.status_code} for {cid}", "WARN")
+                self._record(gateway, -1.0)
+                return False
+            length = r.headers.get("Content-Length")
+            if max_bytes is not None and length is not None and offset + int(length) > max_bytes:
+                raise InputTooLarge(f"{cid} is {offset + int(length)} bytes, limit is {max_bytes}")
+            received = offset
+            try:
+                with open(part, mode) as f:
+                    for chunk in r.iter_content(chunk_size=self.chunk_size):
+                        received += len(chunk)
+                        if max_bytes is not None and received > max_bytes:
+                            raise InputTooLarge(f"{cid} exceeded {max_bytes} bytes while downloading")
+                        f.write(chunk)
+            finally:
+                METRICS.inc("downloaded_bytes_total", received - offset, source="ipfs")
+            if length is not None and received != offset + int(length):
+                raise requests.ConnectionError(f"short read: {received - offset} of {length} bytes")
+        self._record(gateway, (received - offset) / max(time.time() - started, 1e-3))
+        return True
@@ -0,0 +1,67 @@
+import json
+import sqlite3
+import threading
+import time
+
+# Stages after which a job needs nothing more from this node
+TERMINAL_STAGES = ("done", "failed", "closed")
+
+
+# Append-only log of each job's stage transitions (claim tx sent, claimed, inputs fetched,
+# executed, complete tx sent, done/failed), kept in SQLite in WAL mode with synchronous=FULL
+# so every entry is on disk before the node acts on it. After a restart the unfinished
+# jobs are read back and resumed from their last durable stage.
+class JobJournal:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " chain_job_id INTEGER NOT NULL,"
+            " job_id TEXT,"
+            " stage TEXT NOT NULL,"
+            " data TEXT NOT NULL,"
+            " at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_job ON entries (chain_job_id, seq)")
+
+    def record(self, ctx, stage, **data):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO entries (chain_job_id, job_id, stage, data, at) VALUES (?, ?, ?, ?, ?)",
+                (ctx.chain_job_id, str(ctx.job_id), stage, json.dumps(data), time.time()),
+            )
+
+    def unfinished(self):
+        # {chain_job_id: state} for jobs whose last entry is not terminal. `state` merges the
+        # data of all the job's entries (later values win) and adds the last "stage".
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT chain_job_id, stage, data FROM entries ORDER BY seq").fetchall()
+        jobs = {}
+        for chain_job_id, stage, data in rows:
+            state = jobs.setdefault(chain_job_id, {})
+            state.update(json.loads(data))
+            state["stage"] = stage
+        return {k: v for k, v in jobs.items() if v["stage"] not in TERMINAL_STAGES}
+
+    def compact(self):
+        # Drops the history of jobs that have reached a terminal stage
+        placeholders = ", ".join("?" for _ in TERMINAL_STAGES)
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM entries WHERE chain_job_id IN ("
+                " SELECT e.chain_job_id FROM entries e"
+                " WHERE e.seq = (SELECT MAX(seq) FROM entries WHERE chain_job_id = e.chain_job_id)"
+                f" AND e.stage IN ({placeholders}))",
+                TERMINAL_STAGES,
+            )
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,188 @@
+import bisect
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from algolions_node.util import log, save_json_atomic
+
+PREFIX = "algolions_"
+# Seconds; wide enough for both RPC calls and 15-minute model runs
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 900)
+
+
+def _labels(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _fmt_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+# Process-wide counters, histograms and gauges, rendered in the Prometheus text format.
+# Gauges are callbacks read at scrape time (queue depths, pending updates, ...).
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._gauges = {}
+        self._marks = {}
+
+    def inc(self, name, value=1, **labels):
+        key = (name, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, _labels(labels))
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = [[0] * len(DEFAULT_BUCKETS), 0.0, 0]
+            idx = bisect.bisect_left(DEFAULT_BUCKETS, seconds)
+            if idx < len(DEFAULT_BUCKETS):
+                hist[0][idx] += 1
+            hist[1] += seconds
+            hist[2] += 1
+
+    @contextmanager
+    def timer(self, name, **labels):
+        started = time.time()
+        try:
+            yield
+        finally:
+            self.observe(name, time.time() - started, **labels)
+
+    def record_call(self, kind, name, seconds, ok):
+        # e.g. kind="rpc", name="eth_call" -> rpc_requests_total / rpc_errors_total / rpc_request_seconds
+        self.inc(f"{kind}_requests_total", call=name)
+        if not ok:
+            self.inc(f"{kind}_errors_total", call=name)
+        self.observe(f"{kind}_request_seconds", seconds, call=name)
+
+    def gauge(self, name, fn):
+        # fn() returns a number, or a labelled() mapping for a gauge with several series
+        with self._lock:
+            self._gauges[name] = fn
+
+    def mark(self, name):
+        # Timestamps for "events in the last hour" style gauges
+        now = time.time()
+        with self._lock:
+            events = self._marks.setdefault(name, deque())
+            events.append(now)
+            while events and events[0] < now - 3600:
+                events.popleft()
+
+    def count_last_hour(self, name):
+        cutoff = time.time() - 3600
+        with self._lock:
+            return sum(1 for t in self._marks.get(name, ()) if t >= cutoff)
+
+    def _read_gauges(self):
+        with self._lock:
+            gauges = dict(self._gauges)
+        values = {}
+        for name, fn in gauges.items():
+            try:
+                value = fn()
+            except Exception as e:
+                log(f"Metrics gauge {name} failed: {e}", "WARN")
+                continue
+            values[name] = value if isinstance(value, dict) else {(): value}
+        return values
+
+    def render(self):
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((k, (list(v[0]), v[1], v[2])) for k, v in self._histograms.items())
+        typed = set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                lines.append(f"# TYPE {PREFIX}{name} counter")
+                typed.add(name)
+            lines.append(f"{PREFIX}{name}{_fmt_labels(labels)} {value}")
+        for (name, labels), (buckets, total, count) in histograms:
+            if name not in typed:
+                lines.append(f"# TYPE {PREFIX}{name} histogram")
+                typed.add(name)
+            cumulative = 0
+            for bound, n in zip(DEFAULT_BUCKETS, buckets):
+                cumulative += n
+                lines.append(f"{PREFIX}{name}_bucket{_fmt_labels(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{PREFIX}{name}_bucket{_fmt_labels(labels, [('le', '+Inf')])} {count}")
+            lines.append(f"{PREFIX}{name}_sum{_fmt_labels(labels)} {total}")
+            lines.append(f"{PREFIX}{name}_count{_fmt_labels(labels)} {count}")
+        for name, series in sorted(self._read_gauges().items()):
+            lines.append(f"# TYPE {PREFIX}{name} gauge")
+            for labels, value in sorted(series.items()):
+                lines.append(f"{PREFIX}{name}{_fmt_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        # Same data as render(), as plain JSON-friendly dicts
+        def key(name, labels):
+            return name + _fmt_labels(labels)
+
+        with self._lock:
+            counters = {key(n, l): v for (n, l), v in self._counters.items()}
+            histograms = {
+                key(n, l): {"count": v[2], "sum": round(v[1], 6),
+                            "buckets": dict(zip((str(b) for b in DEFAULT_BUCKETS), v[0]))}
+                for (n, l), v in self._histograms.items()
+            }
+        gauges = {key(n, l): v for n, series in self._read_gauges().items() for l, v in series.items()}
+        return {"time": time.time(), "counters": counters, "histograms": histograms, "gauges": gauges}
+
+
+def labelled(label, values):
+    # Turns {"claim": 3, ...} into the {labels: value} form a gauge callback can return
+    return {((label, str(k)),): v for k, v in values.items()}
+
+
+METRICS = Metrics()
+
+
+def serve_metrics(metrics, host, port):
+    # GET /metrics -> Prometheus text format, GET /metrics.json -> snapshot()
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == "/metrics":
+                body, ctype = metrics.render().encode(), "text/plain; version=0.0.4"
+            elif self.path == "/metrics.json":
+                body, ctype = json.dumps(metrics.snapshot()).encode(), "application/json"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+def dump_metrics_periodically(metrics, path, interval):
+    def dump():
+        while True:
+            time.sleep(interval)
+            try:
+                save_json_atomic(path, metrics.snapshot())
+            except OSError as e:
+                log(f"Could not write metrics to {path}: {e}", "WARN")
+
+    threading.Thread(target=dump, name="metrics-dump", daemon=True).start()
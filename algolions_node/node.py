@@ -1,381 +1,946 @@
-import requests
-import json
-import os
-import time
-import hashlib
-import subprocess
-import shutil
-import random
-from datetime import datetime
-from web3 import Web3
-from web3.middleware import ExtraDataToPOAMiddleware
-import platform
-import threading
-import socket
-
-CONFIG_FILE = "node_config.json"
-
-RANDOM_POLL_MIN = float(os.environ.get("RANDOM_POLL_MIN", 5))
-RANDOM_POLL_MAX = float(os.environ.get("RANDOM_POLL_MAX", 11))
-RANDOM_CLAIM_MIN = float(os.environ.get("RANDOM_CLAIM_MIN", 0))
-RANDOM_CLAIM_MAX = float(os.environ.get("RANDOM_CLAIM_MAX", 3))
-
-OUTPUT_SIZE_LIMIT = 100 * 1024 * 1024  # 100 MB
-
-def log(msg, level="INFO"):
-    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    color = {"INFO": "\033[92m", "WARN": "\033[93m", "ERR": "\033[91m", "READY": "\033[96m"}
-    print(f"{color.get(level, '')}[{now}][{level}] {msg}\033[0m", flush=True)
-
-# --- FAIL JOB: Always call with executor=wallet ---
-def fail_job(api_base, job_id, reason, error_code=1, executor=None):
-    try:
-        requests.post(
-            f"{api_base}/fail-job/",
-            data={
-                "job_id": job_id,
-                "reason": reason,
-                "errorCode": error_code,
-                "executor": executor   # <-- Always the node wallet!
-            },
-            timeout=15
-        )
-        log(f"Successfully notified backend of failure for job {job_id} (executor={executor})", "INFO")
-    except Exception as e:
-        log(f"Failed to notify backend of job failure for job {job_id}: {e}", "ERR")
-
-def load_config():
-    with open(CONFIG_FILE) as f:
-        return json.load(f)
-
-def download_ipfs(cid, out_path):
-    try:
-        url = f"https://ipfs.io/ipfs/{cid}"
-        r = requests.get(url, timeout=60)
-        if r.ok:
-            with open(out_path, "wb") as f:
-                f.write(r.content)
-            return True
-        log(f"IPFS download failed: {cid}", "WARN")
-        return False
-    except Exception as e:
-        log(f"Error downloading from IPFS: {e}", "ERR")
-        return False
-
-def robust_post(url, data=None, files=None, headers=None, max_attempts=3, delay=3):
-    attempt = 0
-    while attempt < max_attempts:
-        try:
-            r = requests.post(url, data=data, files=files, headers=headers, timeout=15)
-            if r.ok:
-                return r
-            log(f"Backend update failed ({r.status_code}): {r.text.strip()}", "WARN")
-        except requests.RequestException as e:
-            log(f"Backend POST error: {e}", "WARN")
-        attempt += 1
-        time.sleep(delay * attempt)
-    return None
-
-def submit_job_result(api_base, job_id, wallet, result_path, api_key=None):
-    url = f"{api_base}/api/submit-result/"
-    with open(result_path, "rb") as rf:
-        files = {"result_file": (os.path.basename(result_path), rf)}
-        data = {"job_id": job_id, "wallet_address": wallet}
-        headers = {"x-api-key": api_key} if api_key else None
-        r = robust_post(url, data=data, files=files, headers=headers)
-        if r and r.ok:
-            log(f"Result uploaded for job {job_id}.", "INFO")
-            return True
-        log(f"Failed to upload result for job {job_id} after retries.", "ERR")
-        return False
-
-def update_executor_in_questdb(api_base, job_id, wallet_address, api_key=None):
-    url = f"{api_base}/update-job-executor/"
-    data = {"job_id": job_id, "wallet_address": wallet_address}
-    headers = {"x-api-key": api_key} if api_key else None
-    r = robust_post(url, data=data, headers=headers)
-    if r and r.status_code == 200:
-        log(f"Executor for job {job_id} updated in QuestDB.", "INFO")
-        return True
-    else:
-        log(f"Error updating executor in QuestDB for job {job_id}.", "ERR")
-        return False
-
-def update_tx_hash_in_backend(api_base, job_id, tx_hash, api_key=None):
-    url = f"{api_base}/api/update-tx-hash/"
-    data = {"job_id": job_id, "tx_hash": tx_hash}
-    headers = {"x-api-key": api_key} if api_key else None
-    r = robust_post(url, data=data, headers=headers)
-    if r and r.status_code == 200:
-        log(f"Transaction hash for job {job_id} updated in backend.", "INFO")
-        return True
-    else:
-        log(f"Error updating tx hash in backend for job {job_id}.", "ERR")
-        return False
-
-def fail_job_onchain(web3, contract, chain_job_id, reason, error_code, wallet, pk, api_base, job_id):
-    try:
-        nonce = web3.eth.get_transaction_count(wallet)
-        tx = contract.functions.failJob(chain_job_id, reason, error_code).build_transaction({
-            "from": wallet, "nonce": nonce, "gas": 300000, "gasPrice": web3.eth.gas_price
-        })
-        signed_tx = web3.eth.account.sign_transaction(tx, private_key=pk)
-        tx_hash = web3.eth.send_raw_transaction(signed_tx.raw_transaction)
-        web3.eth.wait_for_transaction_receipt(tx_hash)
-        log(f"Job {chain_job_id + 1} failJob called on-chain, tx hash: {tx_hash.hex()}", "ERR")
-        # --- Always update backend QuestDB as well ---
-        return tx_hash.hex()
-    except Exception as e:
-        log(f"Failed to call failJob on-chain for job {chain_job_id + 1}: {e}", "ERR")
-        return None
-
-def get_result_hash(filepath):
-    with open(filepath, "rb") as f:
-        return hashlib.sha256(f.read()).hexdigest()  # 64-char hex string
-
-def get_node_info(config):
-    node_id = config["node_id"]
-    country = config.get("country", "N/A")
-    hardware = config.get("hardware", "N/A")
-    status = "active"
-    return node_id, country, hardware, status
-
-def send_heartbeat_periodically(node_id, country, hardware, status, uptime_fn, api_base):
-    def heartbeat():
-        payload = {
-            "node_id": node_id,
-            "country": country,
-            "hardware": hardware,
-            "status": status,
-            "uptime": uptime_fn(),
-        }
-        try:
-            requests.post(f"{api_base}/api/network/heartbeat", json=payload, timeout=5)
-        except Exception as e:
-            print(f"[WARN] Heartbeat failed: {e}")
-        threading.Timer(60, heartbeat).start()  # Every 60 seconds
-    heartbeat()
-
-# --- Robust reward withdrawal util (add near your log utilities) ---
-
-def check_node_eligibility(api_base, node_id):
-    try:
-        url = f"{api_base}/api/node-eligibility/{node_id}"
-        r = requests.get(url, timeout=10)
-        if r.ok:
-            data = r.json()
-            return data.get("eligible", False), data
-        else:
-            return False, {"error": "Eligibility API error", "msg": r.text}
-    except Exception as e:
-        return False, {"error": "Eligibility check failed", "msg": str(e)}
-
-def try_withdraw_rewards(contract, web3, wallet, private_key, max_attempts=5, delay=2):
-    for attempt in range(1, max_attempts + 1):
-        try:
-            nonce = web3.eth.get_transaction_count(wallet)
-            tx = contract.functions.withdrawRewards().build_transaction({
-                "from": wallet,
-                "nonce": nonce,
-                "gas": 200_000,
-                "gasPrice": web3.eth.gas_price,
-            })
-            signed_tx = web3.eth.account.sign_transaction(tx, private_key=private_key)
-            # Try both attribute names for compatibility
-            raw_tx = getattr(signed_tx, 'rawTransaction', None) or getattr(signed_tx, 'raw_transaction', None)
-            if raw_tx is None:
-                raise AttributeError(f"SignedTransaction has no 'rawTransaction' or 'raw_transaction'. Found: {dir(signed_tx)}")
-            tx_hash = web3.eth.send_raw_transaction(raw_tx)
-            web3.eth.wait_for_transaction_receipt(tx_hash)
-            log(f"✅ Rewards withdrawal succeeded! TX: {tx_hash.hex()}", "READY")
-            return True
-        except Exception as e:
-            if attempt == max_attempts:
-                log(f"Reward withdrawal ultimately failed after {max_attempts} attempts: {e}", "WARN")
-            else:
-                log(f"Withdraw attempt {attempt} failed: {e} (retrying in {delay} sec)", "WARN")
-                time.sleep(delay)
-                delay = min(delay * 2, 30)
-    return False
-
-
-def main():
-    config = load_config()
-    wallet, pk, api_base, eth_node_url, contract_address, abi_path = (
-        config["wallet_address"], config["private_key"], config["api_base"],
-        config["eth_node_url"], config["contract_address"], config["abi_path"]
-    )
-    api_key = config.get("api_key")  # Optional
-
-    with open(abi_path) as f:
-        abi = json.load(f)["abi"]
-
-    web3 = Web3(Web3.HTTPProvider(eth_node_url))
-    web3.middleware_onion.inject(ExtraDataToPOAMiddleware, layer=0)
-    contract = web3.eth.contract(address=web3.to_checksum_address(contract_address), abi=abi)
-
-    log(f"Node wallet: {wallet}", "INFO")
-    log(f"API base: {api_base}", "INFO")
-
-    # -------- Heartbeat setup ---------
-    node_id, country, hardware, status = get_node_info(config)
-    start_time = time.time()
-    def get_uptime():
-        return round(time.time() - start_time, 2)
-    send_heartbeat_periodically(node_id, country, hardware, status, get_uptime, api_base)
-    # ----------------------------------
-
-    while True:
-        try:
-            jobs = requests.get(f"{api_base}/api/unclaimed-jobs").json()
-        except Exception as e:
-            log(f"API error: {e}", "ERR")
-            poll_delay = random.uniform(RANDOM_POLL_MIN, RANDOM_POLL_MAX)
-            log(f"Waiting {poll_delay:.2f}s before next poll (randomized)", "INFO")
-            time.sleep(poll_delay)
-            continue
-
-        for job in jobs:
-            job_id = job["job_id"]
-            chain_job_id = job.get("chain_job_id")
-            if chain_job_id is None:
-                log(f"Job {job_id} has no chain_job_id! Skipping.", "ERR")
-                continue
-
-            try:
-                job_count = contract.functions.jobCount().call()
-                if chain_job_id < 0 or chain_job_id >= job_count:
-                    log(f"Job {job_id} skipped: on-chain job index {chain_job_id} out of range [0, {job_count-1}]", "WARN")
-                    continue
-            except Exception as e:
-                log(f"Could not fetch jobCount from contract: {e}", "ERR")
-                continue
-
-            try:
-                job_struct = contract.functions.jobs(chain_job_id).call()
-            except Exception as e:
-                log(f"On-chain fetch failed for job {job_id} (on-chain idx {chain_job_id}): {e}", "WARN")
-                continue
-
-            on_chain_status = job_struct[9]
-            if on_chain_status != 0:
-                log(f"Job {job_id} skipped: status is not 'Submitted' (status={on_chain_status})", "INFO")
-                continue
-
-            # Claim on-chain (with improved error handling)
-            delay = random.uniform(RANDOM_CLAIM_MIN, RANDOM_CLAIM_MAX)
-            if delay > 0:
-                log(f"Waiting {delay:.2f}s before claiming job {chain_job_id+1} (randomized)...", "INFO")
-                time.sleep(delay)
-            try:
-                nonce = web3.eth.get_transaction_count(wallet)
-                tx = contract.functions.claimJob(chain_job_id).build_transaction({
-                    "from": wallet, "nonce": nonce, "gas": 500000, "gasPrice": web3.eth.gas_price
-                })
-                signed_tx = web3.eth.account.sign_transaction(tx, private_key=pk)
-                tx_hash = web3.eth.send_raw_transaction(signed_tx.raw_transaction)
-                web3.eth.wait_for_transaction_receipt(tx_hash)
-                log(f"Job {chain_job_id + 1} claimed on-chain, tx hash: {tx_hash.hex()}", "READY")
-                update_tx_hash_in_backend(api_base, job_id, tx_hash.hex(), api_key)
-                update_executor_in_questdb(api_base, job_id, wallet, api_key)
-            except Exception as e:
-                if hasattr(e, 'args') and len(e.args) > 0 and "Job unavailable" in str(e.args[0]):
-                    log(f"Job {chain_job_id + 1} unavailable, skipping. (Another node may have claimed it)", "WARN")
-                    continue
-                else:
-                    log(f"On-chain claim failed for job {chain_job_id + 1}: {e}", "ERR")
-                    continue
-
-            try:
-                requests.post(f"{api_base}/claim-job/", data={"job_id": job_id, "wallet_address": wallet})
-            except Exception as e:
-                log(f"Backend claim-job failed: {e}", "WARN")
-
-            log(f"Job {job_id} claimed. Running model...", "INFO")
-
-            sandbox = os.path.join("sandbox", f"{job_id}_{int(time.time())}")
-            os.makedirs(sandbox, exist_ok=True)
-            try:
-                model_path = os.path.join(sandbox, "model.py")
-                data_path = os.path.join(sandbox, "data.csv")
-                output_path = os.path.join(sandbox, f"result_{job_id}.txt")
-
-                # --- Download model.py from IPFS ---
-                if not download_ipfs(job["model_cid"], model_path):
-                    log(f"Failed to download model.py for job {job_id}", "WARN")
-                    fail_job_onchain(web3, contract, chain_job_id, "Model download failed", 2, wallet, pk, api_base, job_id)
-                    fail_job(api_base, job_id, "Model download failed", 2, executor=wallet)
-                    continue
-
-                # --- Download dataset.csv from IPFS ---
-                if not download_ipfs(job["dataset_cid"], data_path):
-                    log(f"Failed to download data.csv for job {job_id}", "WARN")
-                    fail_job_onchain(web3, contract, chain_job_id, "Dataset download failed", 3, wallet, pk, api_base, job_id)
-                    fail_job(api_base, job_id, "Dataset download failed", 3, executor=wallet)
-                    continue
-
-                # --- Execute model.py ---
-                exec_result = subprocess.run(
-                    ["python", model_path, data_path, output_path],
-                    stdout=subprocess.DEVNULL,
-                    stderr=subprocess.DEVNULL,
-                    timeout=900  # 15 min
-                )
-                if exec_result.returncode != 0:
-                    log(f"Job execution failed for job {job_id}", "ERR")
-                    fail_job_onchain(web3, contract, chain_job_id, "Execution failed", 1, wallet, pk, api_base, job_id)
-                    fail_job(api_base, job_id, "Execution failed", 1, executor=wallet)
-                    continue
-
-                # --- OUTPUT SIZE CHECK ---
-                if os.path.exists(output_path):
-                    if os.path.getsize(output_path) > OUTPUT_SIZE_LIMIT:
-                        os.remove(output_path)
-                        log(f"Output for job {job_id} exceeded {OUTPUT_SIZE_LIMIT // (1024*1024)}MB! Marking as failed.", "ERR")
-                        fail_job_onchain(web3, contract, chain_job_id, "Output file exceeded size limit", 4, wallet, pk, api_base, job_id)
-                        fail_job(api_base, job_id, "Output file exceeded size limit", 4, executor=wallet)
-                        continue
-
-                # --- SUBMIT FINALIZATION ON-CHAIN FROM NODE ---
-                result_hash = get_result_hash(output_path)
-                if isinstance(result_hash, str):
-                    result_hash_bytes32 = bytes.fromhex(result_hash)
-                else:
-                    result_hash_bytes32 = result_hash
-                nonce = web3.eth.get_transaction_count(wallet)
-                tx = contract.functions.completeJob(chain_job_id, result_hash_bytes32).build_transaction({
-                    "from": wallet, "nonce": nonce, "gas": 300000, "gasPrice": web3.eth.gas_price
-                })
-                signed_tx = web3.eth.account.sign_transaction(tx, private_key=pk)
-                tx_hash = web3.eth.send_raw_transaction(signed_tx.raw_transaction)
-                web3.eth.wait_for_transaction_receipt(tx_hash)
-                log(f"Job {job_id} completeJob called on-chain, tx hash: {tx_hash.hex()}", "READY")
-                update_tx_hash_in_backend(api_base, job_id, tx_hash.hex(), api_key)
-
-                # Optionally POST result to backend for record/log
-                submit_job_result(api_base, job_id, wallet, output_path, api_key)
-                log(f"Job {job_id} result uploaded and finalized!", "READY")
-
-                # --- 💸 Withdraw rewards if paid job, but only if eligible! ---
-                job_struct = contract.functions.jobs(chain_job_id).call()
-                is_paid = job_struct.paid if hasattr(job_struct, "paid") else job_struct[12]
-                if is_paid:
-                    is_eligible, elig_info = check_node_eligibility(api_base, wallet)
-                    if is_eligible:
-                        try_withdraw_rewards(contract, web3, wallet, pk)
-                    else:
-                        log(f"Skipping withdraw: not eligible. Reason: {elig_info.get('message', 'Check rating/num_ratings on dashboard.')}", "WARN")
-                else:
-                    log(f"No rewards to withdraw for job {job_id} (free/unpaid job)", "INFO")
-
-            finally:
-                shutil.rmtree(sandbox)
-
-        poll_delay = random.uniform(RANDOM_POLL_MIN, RANDOM_POLL_MAX)
-        time.sleep(poll_delay)
-
-if __name__ == "__main__":
-    try:
-        main()
-    except KeyboardInterrupt:
-        print("\n\033[96m[EXIT] Micro Aladdin Node has been shut down safely. 🦁✨\033[0m")
+import requests
+import json
+import os
+import time
+import shutil
+from web3 import Web3
+from web3.exceptions import ContractLogicError, TransactionNotFound
+from web3.middleware import ExtraDataToPOAMiddleware
+import platform
+import socket
+
+from algolions_node.backend import BackendClient, Outbox
+from algolions_node.chainreads import (STATUS_CLAIMED, STATUS_COMPLETED, STATUS_FAILED, STATUS_SUBMITTED,
+                                       ChainReader, InstrumentedHTTPProvider)
+from algolions_node.cidcache import CidCache
+from algolions_node.discovery import ChainJobFeed, EventJobSource
+from algolions_node.executor import OUTPUT_SIZE_LIMIT, WarmPool, hash_file, run_model
+from algolions_node.fees import FeeEngine
+from algolions_node.heartbeat import Heartbeat
+from algolions_node.identities import Identity, assign_identity, identity_for, identity_settings
+from algolions_node.ipfs import InputTooLarge, IpfsFetcher
+from algolions_node.journal import TERMINAL_STAGES, JobJournal
+from algolions_node.metrics import METRICS, dump_metrics_periodically, labelled, serve_metrics
+from algolions_node.pipeline import JobContext, JobPipeline, RetryQueue, Stage
+from algolions_node.resources import (DEFAULT_JOB_MEMORY_MB, cpu_budget, default_execution_slots, memory_budget,
+                                      memory_used)
+from algolions_node.rewards import RewardsService
+from algolions_node.sandbox import MB, CgroupGovernor, MemoryBudget, UsageHistory, job_limits
+from algolions_node.scheduler import ClaimScheduler
+from algolions_node.txmanager import TransactionReverted, TxManager
+from algolions_node.upload import ChunkedUploadUnavailable, ResultUploader
+from algolions_node.util import LOG_FORMAT, log, set_log_format
+from algolions_node.zygote import DEFAULT_PRELOAD
+
+CONFIG_FILE = "node_config.json"
+
+# On-chain job records read during polling are reused by the claim stage up to this age
+RECORD_MAX_AGE = 10
+
+
+# --- FAIL JOB: Always call with executor=wallet ---
+def fail_job(outbox, job_id, reason, error_code=1, executor=None):
+    outbox.put(f"fail:{job_id}", "/fail-job/", {
+        "job_id": job_id,
+        "reason": reason,
+        "errorCode": error_code,
+        "executor": executor   # <-- Always the node wallet!
+    }, label=f"failure of job {job_id} (executor={executor})")
+
+def load_config():
+    with open(CONFIG_FILE) as f:
+        return json.load(f)
+
+def robust_post(client, path, data=None, files=None, auth=False, max_attempts=3, delay=3):
+    attempt = 0
+    while attempt < max_attempts:
+        try:
+            r = client.post(path, data=data, files=files, auth=auth)
+            if r.ok:
+                return r
+            log(f"Backend update failed ({r.status_code}): {r.text.strip()}", "WARN")
+        except requests.RequestException as e:
+            log(f"Backend POST error: {e}", "WARN")
+        attempt += 1
+        time.sleep(delay * attempt)
+    return None
+
+def submit_job_result(client, job_id, wallet, result_path):
+    with open(result_path, "rb") as rf:
+        files = {"result_file": (os.path.basename(result_path), rf)}
+        data = {"job_id": job_id, "wallet_address": wallet}
+        r = robust_post(client, "/api/submit-result/", data=data, files=files, auth=True)
+        if r and r.ok:
+            METRICS.inc("uploaded_bytes_total", os.path.getsize(result_path), dest="backend")
+            log(f"Result uploaded for job {job_id}.", "INFO")
+            return True
+        log(f"Failed to upload result for job {job_id} after retries.", "ERR")
+        return False
+
+# Bookkeeping updates go through the outbox: queued durably, delivered in the background,
+# and a newer tx hash for the same job replaces one still waiting to be sent
+def update_executor_in_questdb(outbox, job_id, wallet_address):
+    outbox.put(f"executor:{job_id}", "/update-job-executor/",
+               {"job_id": job_id, "wallet_address": wallet_address},
+               auth=True, label=f"executor for job {job_id}")
+
+def update_tx_hash_in_backend(outbox, job_id, tx_hash):
+    outbox.put(f"tx_hash:{job_id}", "/api/update-tx-hash/",
+               {"job_id": job_id, "tx_hash": tx_hash},
+               auth=True, label=f"tx hash for job {job_id}")
+
+def fail_job_onchain(txm, contract, chain_job_id, reason, error_code):
+    # Returns the tx's Future, or None if it could not be sent
+    try:
+        fut = txm.submit(contract.functions.failJob(chain_job_id, reason, error_code), 300000)
+        log(f"Job {chain_job_id + 1} failJob sent on-chain, tx hash: {fut.tx_hash.hex()}", "ERR")
+        return fut
+    except Exception as e:
+        log(f"Failed to call failJob on-chain for job {chain_job_id + 1}: {e}", "ERR")
+        return None
+
+def node_telemetry(env, pipeline, slots, cid_limit=50):
+    # Live capacity signals sent with each heartbeat so the backend can route jobs
+    counts = pipeline.stage_counts()
+    load_1m = os.getloadavg()[0] if hasattr(os, "getloadavg") else None
+    telemetry = {
+        "execution_slots": slots,
+        "free_slots": max(slots - counts.get("execute", 0), 0),
+        "claim_capacity": env.scheduler.capacity(pipeline) if env.scheduler is not None else None,
+        "jobs_in_flight": pipeline.in_flight(),
+        "stage_counts": dict(counts),
+        "queue_depths": pipeline.queue_depths(),
+        "cpus": cpu_budget(),
+        "load_1m": load_1m,
+        "memory_used_bytes": memory_used(),
+        "memory_budget_free_bytes": env.memory.free() if env.memory is not None else None,
+        "jobs_last_hour": METRICS.count_last_hour("jobs_done"),
+    }
+    if env.cache is not None:
+        stats = env.cache.stats()
+        telemetry["cid_cache"] = {"entries": stats["entries"], "bytes": stats["bytes"],
+                                  "recent": env.cache.recent(cid_limit)}
+    return telemetry
+
+def start_heartbeat(config, env, pipeline, slots, client):
+    start_time = time.time()
+    node_ids = [identity.node_id for identity in env.identities]
+
+    def payloads():
+        # One heartbeat per identity; the host's capacity is shared by all of them
+        try:
+            capacity = node_telemetry(env, pipeline, slots, config.get("heartbeat_cached_cids", 50))
+        except Exception as e:
+            log(f"Could not collect heartbeat telemetry: {e}", "WARN")
+            capacity = None
+        beats = []
+        for identity in env.identities:
+            data = {
+                "node_id": identity.node_id,
+                "country": identity.country,
+                "hardware": identity.hardware,
+                "status": "active",
+                "uptime": round(time.time() - start_time, 2),
+            }
+            if capacity is not None:
+                data["capacity"] = dict(capacity, wallet_jobs_in_flight=identity.in_flight(),
+                                        shared_with=[n for n in node_ids if n != identity.node_id])
+            beats.append(data)
+        return beats
+
+    heartbeat = Heartbeat(client, payloads, config.get("heartbeat_interval", 60))
+    heartbeat.start()
+    return heartbeat
+
+# --- Reward withdrawal eligibility (cached by RewardsService) ---
+
+def check_node_eligibility(client, node_id):
+    try:
+        r = client.get(f"/api/node-eligibility/{node_id}", endpoint="/api/node-eligibility")
+        if r.ok:
+            data = r.json()
+            return data.get("eligible", False), data
+        else:
+            return False, {"error": "Eligibility API error", "msg": r.text}
+    except Exception as e:
+        return False, {"error": "Eligibility check failed", "msg": str(e)}
+
+
+# --- Pipeline stages: claim -> fetch -> execute -> finalize -> upload ---
+
+class NodeEnv:
+    # Shared handles every pipeline stage needs
+    def __init__(self, config, web3, contract, reader, identities, fetcher, backend, outbox, cache=None):
+        self.config = config
+        self.web3 = web3
+        self.contract = contract
+        self.reader = reader
+        self.identities = identities
+        self.fetcher = fetcher
+        self.backend = backend
+        self.outbox = outbox
+        self.cache = cache
+        self.feed = None
+        self.scheduler = None
+        self.journal = None
+        self.retries = None
+        self.uploader = None
+        self.warm_pool = None
+        self.limits = job_limits(config, cpu_budget(), OUTPUT_SIZE_LIMIT)
+        self.cgroups = None
+        self.memory = None
+        self.usage = UsageHistory()
+        max_input_mb = config.get("max_input_mb")
+        self.max_input_bytes = max_input_mb * 1024 * 1024 if max_input_mb else None
+
+
+def fetch_input(env, cid, out_path, max_bytes=None):
+    try:
+        if env.cache is None:
+            return env.fetcher.fetch(cid, out_path, max_bytes)
+        cached_size = env.cache.size_of(cid)
+        if max_bytes is not None and cached_size is not None and cached_size > max_bytes:
+            raise InputTooLarge(f"{cid} is {cached_size} bytes, limit is {max_bytes}")
+        return env.cache.fetch(cid, out_path, lambda c, p: env.fetcher.fetch(c, p, max_bytes),
+                               lambda c, p: env.fetcher.fetch_car(c, p, max_bytes))
+    except OSError as e:
+        log(f"Error downloading from IPFS: {e}", "ERR")
+        return False
+
+
+def note_stage(env, ctx, stage, **data):
+    if env.journal is not None:
+        env.journal.record(ctx, stage, **data)
+    ctx.journaled = stage
+
+
+def fail_job_everywhere(env, ctx, reason, error_code, onchain_code=None):
+    # failJob reverts for codes above 4, so finer-grained codes only go to the backend
+    # and the chain gets `onchain_code`
+    ctx.failure = {"fail_reason": reason, "onchain_code": error_code if onchain_code is None else onchain_code}
+    fail_job(env.outbox, ctx.job_id, reason, error_code, executor=ctx.identity.wallet)
+    send_fail(env, ctx, error_code=error_code)
+
+
+def send_fail(env, ctx, **data):
+    # The job stays at fail_sent until failJob is mined, then becomes failed; a failJob that
+    # could not be sent or did not confirm is sent again later
+    fut = fail_job_onchain(ctx.identity.txm, env.contract, ctx.chain_job_id, ctx.failure["fail_reason"],
+                           ctx.failure["onchain_code"])
+    ctx.failure["fail_tx"] = fut.tx_hash.hex() if fut else None
+    note_stage(env, ctx, "fail_sent", **ctx.failure, **data)
+    if fut is None:
+        retry_fail(env, ctx)
+    else:
+        fut.add_done_callback(lambda f: fail_settled(env, ctx, f))
+
+
+def fail_settled(env, ctx, fut):
+    e = fut.exception()
+    if e is None:
+        note_stage(env, ctx, "failed")
+    elif isinstance(e, TransactionReverted):
+        # Already failed by an earlier failJob, or no longer claimed by us
+        log(f"failJob for job {ctx.chain_job_id + 1} reverted", "ERR")
+        note_stage(env, ctx, "closed", last_stage="fail_sent")
+    else:
+        log(f"failJob for job {ctx.chain_job_id + 1} did not confirm: {e}", "ERR")
+        retry_fail(env, ctx)
+
+
+def retry_fail(env, ctx):
+    if env.retries is not None:
+        delay = env.retries.add(ctx)
+        log(f"Sending failJob for job {ctx.job_id} again in {delay}s", "WARN")
+
+
+def claim_stage(env, ctx):
+    job_id, chain_job_id = ctx.job_id, ctx.chain_job_id
+    contract, identity = env.contract, ctx.identity
+    if ctx.record is None or time.time() - ctx.record_at > RECORD_MAX_AGE:
+        try:
+            ctx.record, ctx.record_at = env.reader.read_job(chain_job_id), time.time()
+        except Exception as e:
+            log(f"On-chain fetch failed for job {job_id} (on-chain idx {chain_job_id}): {e}", "WARN")
+            return False
+        if ctx.record is None:
+            log(f"Job {job_id} skipped: on-chain job index {chain_job_id} out of range or unreadable", "WARN")
+            return False
+
+    on_chain_status = ctx.record.status
+    if on_chain_status != STATUS_SUBMITTED:
+        log(f"Job {job_id} skipped: status is not 'Submitted' (status={on_chain_status})", "INFO")
+        if env.feed is not None:
+            env.feed.mark_closed(chain_job_id)
+        return False
+
+    # Claim on-chain (with improved error handling)
+    # Journaled before broadcasting, so a restart knows a claim may be on its way
+    note_stage(env, ctx, "claiming", job=ctx.job, wallet=identity.wallet)
+    claim = None
+    try:
+        with METRICS.timer("step_seconds", step="claim_tx"):
+            claim = identity.txm.submit(contract.functions.claimJob(chain_job_id), 500000)
+            ctx.claim_tx = claim.tx_hash.hex()
+            note_stage(env, ctx, "claim_sent", claim_tx=ctx.claim_tx)
+            # The tx manager gives up at confirm_timeout; the margin only covers a stalled monitor
+            receipt = claim.result(timeout=identity.txm.confirm_timeout + 30)
+        tx_hash = receipt["transactionHash"].hex()
+        log(f"Job {chain_job_id + 1} claimed on-chain, tx hash: {tx_hash}", "READY")
+        announce_claim(env, ctx, tx_hash)
+        METRICS.inc("claims_total", outcome="won")
+    except Exception as e:
+        if isinstance(e, (TransactionReverted, ContractLogicError)) or (hasattr(e, 'args') and len(e.args) > 0 and "Job unavailable" in str(e.args[0])):
+            METRICS.inc("claims_total", outcome="lost")
+            log(f"Job {chain_job_id + 1} unavailable, skipping. (Another node may have claimed it)", "WARN")
+            note_stage(env, ctx, "closed", last_stage=ctx.journaled)
+        else:
+            # Timed out, replaced or the RPC failed: the claim may still land, so the job
+            # stays at claim_sent and cleanup_job has it checked again later
+            METRICS.inc("claims_total", outcome="error")
+            log(f"On-chain claim failed for job {chain_job_id + 1}: {e}", "ERR")
+            if claim is not None and claim.tx_hash.hex() != ctx.claim_tx:
+                # Fee bumps change the hash; a restart has to look for the latest one
+                ctx.claim_tx = claim.tx_hash.hex()
+                note_stage(env, ctx, "claim_sent", claim_tx=ctx.claim_tx)
+        return False
+
+    log(f"Job {job_id} claimed. Fetching inputs...", "INFO")
+    return True
+
+
+def announce_claim(env, ctx, tx_hash):
+    # Journals a claim that landed and tells the backend about it
+    job_id = ctx.job_id
+    note_stage(env, ctx, "claimed", claim_tx=tx_hash)
+    if tx_hash:
+        update_tx_hash_in_backend(env.outbox, job_id, tx_hash)
+    update_executor_in_questdb(env.outbox, job_id, ctx.identity.wallet)
+    env.outbox.put(f"claim:{job_id}", "/claim-job/", {"job_id": job_id, "wallet_address": ctx.identity.wallet},
+                   label=f"claim of job {job_id}")
+
+
+def fetch_stage(env, ctx):
+    job_id = ctx.job_id
+    ctx.sandbox = os.path.join("sandbox", f"{job_id}_{int(time.time())}")
+    os.makedirs(ctx.sandbox, exist_ok=True)
+    ctx.model_path = os.path.join(ctx.sandbox, "model.py")
+    ctx.data_path = os.path.join(ctx.sandbox, "data.csv")
+    ctx.output_path = os.path.join(ctx.sandbox, f"result_{job_id}.txt")
+
+    # Model and dataset share one per-job input budget
+    budget = env.max_input_bytes
+    try:
+        # --- Download model.py from IPFS ---
+        with METRICS.timer("step_seconds", step="fetch_model"):
+            model_ok = fetch_input(env, ctx.job["model_cid"], ctx.model_path, budget)
+        if not model_ok:
+            log(f"Failed to download model.py for job {job_id}", "WARN")
+            fail_job_everywhere(env, ctx, "Model download failed", 2)
+            return False
+        if budget is not None:
+            budget -= os.path.getsize(ctx.model_path)
+
+        # --- Download dataset.csv from IPFS ---
+        with METRICS.timer("step_seconds", step="fetch_dataset"):
+            data_ok = fetch_input(env, ctx.job["dataset_cid"], ctx.data_path, budget)
+        if not data_ok:
+            log(f"Failed to download data.csv for job {job_id}", "WARN")
+            fail_job_everywhere(env, ctx, "Dataset download failed", 3)
+            return False
+    except InputTooLarge as e:
+        log(f"Inputs for job {job_id} exceed {env.config['max_input_mb']}MB: {e}", "ERR")
+        fail_job_everywhere(env, ctx, "Input files exceeded size limit", 5, onchain_code=3)
+        return False
+    note_stage(env, ctx, "fetched", sandbox=ctx.sandbox, model_path=ctx.model_path,
+               data_path=ctx.data_path, output_path=ctx.output_path)
+    return True
+
+
+def execute_stage(env, ctx):
+    job_id = ctx.job_id
+    model_cid = ctx.job["model_cid"]
+
+    # Admit the job once its expected memory (last known peak for this model) fits
+    history = env.usage.get(model_cid)
+    expected = env.limits["memory_bytes"]
+    if history and history["peak_rss"]:
+        expected = min(expected, int(history["peak_rss"] * 1.25))
+    reserved = env.memory.reserve(expected)
+    try:
+        log(f"Running model for job {job_id}...", "INFO")
+        # Output size is enforced while the model runs, not after it exits
+        exec_result = run_model(ctx.model_path, ctx.data_path, ctx.output_path, pool=env.warm_pool,
+                                limits=env.limits, cgroups=env.cgroups, cgroup_name=f"job-{job_id}")
+    finally:
+        env.memory.release(reserved)
+        if env.scheduler is not None:
+            env.scheduler.capacity_freed()
+    ctx.usage = exec_result.usage
+    METRICS.observe("step_seconds", exec_result.wall_time, step="model_run")
+    env.usage.record(model_cid, exec_result.usage, exec_result.wall_time)
+    log(f"Job {job_id} ran {exec_result.wall_time:.1f}s: {exec_result.usage}", "INFO")
+
+    if exec_result.limit_exceeded and not exec_result.output_exceeded:
+        log(f"Job {job_id} killed: {exec_result.limit_exceeded} exceeded", "ERR")
+        fail_job_everywhere(env, ctx, f"Resource limit exceeded: {exec_result.limit_exceeded}", 6,
+                            onchain_code=1)
+        return False
+    if exec_result.output_exceeded:
+        if os.path.exists(ctx.output_path):
+            os.remove(ctx.output_path)
+        log(f"Output for job {job_id} exceeded {OUTPUT_SIZE_LIMIT // (1024*1024)}MB! Model killed, marking as failed.", "ERR")
+        fail_job_everywhere(env, ctx, "Output file exceeded size limit", 4)
+        return False
+    if not exec_result.ok or not os.path.exists(ctx.output_path):
+        reason = "timed out" if exec_result.timed_out else f"exit code {exec_result.returncode}"
+        log(f"Job execution failed for job {job_id} ({reason})", "ERR")
+        fail_job_everywhere(env, ctx, "Execution failed", 1)
+        return False
+
+    # Hashed once here; completeJob and the upload both reuse ctx.result_hash
+    with METRICS.timer("step_seconds", step="hash"):
+        ctx.result_hash, ctx.result_size = hash_file(ctx.output_path)
+    note_stage(env, ctx, "executed", result_hash=ctx.result_hash, result_size=ctx.result_size)
+    return True
+
+
+def finalize_stage(env, ctx):
+    job_id, chain_job_id = ctx.job_id, ctx.chain_job_id
+    contract, txm = env.contract, ctx.identity.txm
+
+    # --- SUBMIT FINALIZATION ON-CHAIN FROM NODE ---
+    result_hash = ctx.result_hash
+    if isinstance(result_hash, str):
+        result_hash_bytes32 = bytes.fromhex(result_hash)
+    else:
+        result_hash_bytes32 = result_hash
+    complete = txm.submit(contract.functions.completeJob(chain_job_id, result_hash_bytes32), 300000)
+    tx_hash = complete.tx_hash.hex()
+    note_stage(env, ctx, "complete_sent", complete_tx=tx_hash)
+    log(f"Job {job_id} completeJob sent on-chain, tx hash: {tx_hash}", "READY")
+    update_tx_hash_in_backend(env.outbox, job_id, tx_hash)
+
+    with METRICS.timer("step_seconds", step="complete_wait"):
+        complete.result(timeout=txm.confirm_timeout + 30)
+    note_stage(env, ctx, "completed")
+    log(f"Job {job_id} finalized on-chain!", "READY")
+
+    # --- 💸 Paid job: the rewards service decides when to withdraw, off the job path ---
+    # `paid` is fixed at submission, so the record read before claiming is still accurate
+    if ctx.record.paid:
+        if ctx.identity.rewards is not None:
+            ctx.identity.rewards.job_paid()
+    else:
+        log(f"No rewards to withdraw for job {job_id} (free/unpaid job)", "INFO")
+    return True
+
+
+def upload_result(env, ctx):
+    # Chunked and resumable when the backend supports it, else one multipart POST
+    if env.uploader is not None:
+        try:
+            encoding = env.uploader.upload(ctx.job_id, ctx.identity.wallet, ctx.output_path, ctx.result_hash,
+                                           ctx.result_size)
+            log(f"Result uploaded for job {ctx.job_id} ({ctx.result_size} bytes, encoding={encoding}).", "INFO")
+            return True
+        except ChunkedUploadUnavailable:
+            log("Backend has no chunked upload endpoint; using multipart uploads", "WARN")
+        except (IOError, ValueError, KeyError) as e:
+            log(f"Failed to upload result for job {ctx.job_id}: {e}", "ERR")
+            return False
+    return submit_job_result(env.backend, ctx.job_id, ctx.identity.wallet, ctx.output_path)
+
+
+def upload_stage(env, ctx):
+    # Runs after completeJob has landed, so a slow upload never holds up execution or finalization
+    # A failed upload leaves the job at "completed": cleanup_job keeps it and it is
+    # uploaded again after a backoff, or by the next start
+    with METRICS.timer("step_seconds", step="upload"):
+        if not upload_result(env, ctx):
+            return False
+    note_stage(env, ctx, "done")
+    return True
+
+
+# Stages a job can be picked up from again: a claim whose outcome is not known yet, or a
+# result this node still has to finalize or upload
+RESUMABLE_STAGES = ("claim_sent", "executed", "complete_sent", "completed")
+
+
+def cleanup_job(env, ctx, resumable=True):
+    # Jobs dropped part way (claim lost, a stage crashed) are closed so a restart skips them.
+    # One that stopped with a result in hand (completeJob reverted or timed out, RPC errors)
+    # is still claimed by us on-chain, so it keeps its journal entry and sandbox and is
+    # retried after a backoff; a restart resumes it from the journal too. So is a claim
+    # that was given up on unmined, since it may still land.
+    keep = resumable and ctx.journaled in RESUMABLE_STAGES
+    if ctx.journaled == "fail_sent" and resumable:
+        pass  # fail_settled journals it once failJob is mined or hands it to the retry queue
+    elif keep and env.retries is not None:
+        delay = env.retries.add(ctx)
+        log(f"Job {ctx.job_id} stopped after {ctx.journaled}; retrying in {delay}s", "WARN")
+    elif keep:
+        log(f"Job {ctx.job_id} stopped after {ctx.journaled}; keeping it to resume on the next start", "WARN")
+    elif ctx.journaled is not None and ctx.journaled not in TERMINAL_STAGES:
+        note_stage(env, ctx, "closed", last_stage=ctx.journaled)
+    METRICS.inc("jobs_total", outcome="failed" if ctx.journaled == "fail_sent" else ctx.journaled or "skipped")
+    if ctx.identity is not None:
+        ctx.identity.release()
+    if env.scheduler is not None:
+        env.scheduler.capacity_freed()
+    if ctx.journaled == "done":
+        METRICS.mark("jobs_done")
+    if ctx.sandbox and not keep:
+        shutil.rmtree(ctx.sandbox, ignore_errors=True)
+
+
+def build_cid_cache(config):
+    max_mb = config.get("cid_cache_max_mb", 2048)
+    if not max_mb:
+        return None
+    cache = CidCache(config.get("cid_cache_dir", "cid_cache"), max_mb * 1024 * 1024)
+    stats = cache.stats()
+    log(f"CID cache: {stats['entries']} object(s), {stats['bytes'] // (1024*1024)}/{max_mb}MB used", "INFO")
+    return cache
+
+
+def execution_slots(config):
+    return config.get("max_concurrent_jobs") or default_execution_slots(
+        config.get("job_memory_mb", DEFAULT_JOB_MEMORY_MB))
+
+
+def build_memory_budget(config, slots):
+    # Whatever the container has, minus headroom for the node process itself and the
+    # warm executors, each of which keeps its preloaded libraries resident
+    job_bytes = config.get("job_memory_mb", DEFAULT_JOB_MEMORY_MB) * MB
+    reserved_mb = config.get("node_reserved_memory_mb", 512)
+    if config.get("warm_executor", True):
+        reserved_mb += slots * config.get("warm_executor_memory_mb", 200)
+    total = memory_budget()
+    if total:
+        total = max(total - reserved_mb * MB, job_bytes)
+    else:
+        total = slots * job_bytes
+    return MemoryBudget(total)
+
+
+def build_warm_pool(config, slots):
+    if not config.get("warm_executor", True):
+        return None
+    pool = WarmPool(slots, config.get("warm_preload", DEFAULT_PRELOAD))
+    pool.start()
+    log(f"Warming {slots} executor process(es); jobs use cold starts until they are ready", "INFO")
+    return pool
+
+
+def build_pipeline(env, slots):
+    config = env.config
+    fetch_workers = config.get("fetch_workers", 2)
+    finalize_workers = config.get("finalize_workers", 2)
+    upload_workers = config.get("upload_workers", 2)
+    log(f"Pipeline: {slots} execution slot(s), {fetch_workers} fetch worker(s), {finalize_workers} finalize worker(s), "
+        f"{upload_workers} upload worker(s)", "INFO")
+    stages = [
+        # One claim worker per wallet: each has its own nonce sequence, so claims don't queue behind each other
+        Stage("claim", lambda ctx: claim_stage(env, ctx), workers=len(env.identities), queue_size=slots),
+        Stage("fetch", lambda ctx: fetch_stage(env, ctx), workers=fetch_workers, queue_size=slots),
+        Stage("execute", lambda ctx: execute_stage(env, ctx), workers=slots, queue_size=slots),
+        Stage("finalize", lambda ctx: finalize_stage(env, ctx), workers=finalize_workers, queue_size=slots),
+        # Unbounded: a backlog of uploads must not push back on finalization
+        Stage("upload", lambda ctx: upload_stage(env, ctx), workers=upload_workers, queue_size=0),
+    ]
+    return JobPipeline(stages, on_done=lambda ctx: cleanup_job(env, ctx))
+
+
+# --- Resume after restart ---
+
+def settle_journaled_tx(env, tx_hash, timeout):
+    # Waits for a tx the previous run broadcast but never saw mined
+    try:
+        env.web3.eth.wait_for_transaction_receipt(tx_hash, timeout=timeout)
+    except Exception as e:
+        log(f"Journaled tx {tx_hash} not mined ({e}); treating it as dropped", "WARN")
+
+
+def resume_stage(env, ctx, state):
+    # Pipeline stage to resume a journaled job at, or None if there is nothing left to do
+    record = ctx.record
+    if record is None or identity_for(env.identities, record.executor) is None:
+        return None
+    if record.status == STATUS_CLAIMED:
+        if state.get("result_hash") and os.path.exists(ctx.output_path or ""):
+            ctx.result_hash, ctx.result_size = hash_file(ctx.output_path)
+            if ctx.result_hash == state["result_hash"]:
+                return "finalize"
+        if all(p and os.path.exists(p) for p in (ctx.model_path, ctx.data_path)):
+            return "execute"
+        return "fetch"
+    if record.status == STATUS_COMPLETED and os.path.exists(ctx.output_path or ""):
+        # completeJob landed but the node went down before the result upload finished
+        ctx.result_hash, ctx.result_size = state.get("result_hash"), state.get("result_size")
+        if not ctx.result_hash:
+            ctx.result_hash, ctx.result_size = hash_file(ctx.output_path)
+        return "upload"
+    return None
+
+
+def resume_jobs(env, pipeline):
+    pending = env.journal.unfinished()
+    if not pending:
+        return
+    log(f"Journal: {len(pending)} unfinished job(s) from the previous run", "INFO")
+    # A claim/complete broadcast just before the restart may still be in the mempool
+    for state in pending.values():
+        tx_hash = state.get("complete_tx") if state["stage"] == "complete_sent" else \
+            state.get("claim_tx") if state["stage"] == "claim_sent" else \
+            state.get("fail_tx") if state["stage"] == "fail_sent" else None
+        if tx_hash:
+            settle_journaled_tx(env, tx_hash, env.identities[0].txm.stuck_after)
+    try:
+        records = env.reader.read_jobs(list(pending))
+    except Exception as e:
+        log(f"Could not read journaled jobs from contract, not resuming them: {e}", "ERR")
+        return
+    read_at = time.time()
+
+    for chain_job_id, state in pending.items():
+        ctx = JobContext(state["job"])
+        ctx.record, ctx.record_at = records.get(chain_job_id), read_at
+        ctx.journaled = state["stage"]
+        ctx.sandbox = state.get("sandbox")
+        ctx.model_path, ctx.data_path = state.get("model_path"), state.get("data_path")
+        ctx.output_path = state.get("output_path")
+        ctx.claim_tx = state.get("claim_tx")
+        if "fail_reason" in state:
+            ctx.failure = {key: state.get(key) for key in ("fail_reason", "onchain_code", "fail_tx")}
+        if not requeue_job(env, pipeline, ctx, state) and env.retries is not None:
+            env.retries.add(ctx)
+
+
+def tx_pending(env, tx_hash):
+    # True while the tx sits unmined in the RPC node's mempool
+    if not tx_hash:
+        return False
+    try:
+        return env.web3.eth.get_transaction(tx_hash).get("blockNumber") is None
+    except TransactionNotFound:
+        return False
+
+
+def requeue_job(env, pipeline, ctx, state):
+    # Puts a journaled job back into the pipeline at the stage resume_stage picks, or closes
+    # it if nothing is left to do. Returns False to look at it again later: the job is still
+    # in the pipeline, or its claim is neither mined nor dropped yet.
+    if ctx.journaled == "fail_sent" and ctx.record is not None and ctx.record.status == STATUS_FAILED:
+        note_stage(env, ctx, "failed")  # an earlier failJob landed after all
+    elif ctx.journaled == "fail_sent" and ctx.record is not None and ctx.record.status == STATUS_CLAIMED:
+        identity = identity_for(env.identities, ctx.record.executor)
+        if identity is not None:
+            if tx_pending(env, ctx.failure.get("fail_tx")):
+                log(f"failJob for job {ctx.job_id} is still pending; checking again later", "INFO")
+                return False
+            # failJob never landed: send it again
+            ctx.identity = identity
+            send_fail(env, ctx)
+            return True
+    claiming = ctx.journaled in ("claiming", "claim_sent")
+    if claiming and ctx.record is not None and ctx.record.status == STATUS_SUBMITTED and tx_pending(env, ctx.claim_tx):
+        log(f"Claim for job {ctx.job_id} is still pending; checking again later", "INFO")
+        return False
+    stage = resume_stage(env, ctx, state)
+    if stage is None:
+        status = ctx.record.status if ctx.record else "unreadable"
+        log(f"Journaled job {ctx.job_id} needs no further work (on-chain status={status})", "INFO")
+        cleanup_job(env, ctx, resumable=False)
+        return True
+    if stage == "fetch" and ctx.sandbox:
+        shutil.rmtree(ctx.sandbox, ignore_errors=True)
+    ctx.identity = identity_for(env.identities, ctx.record.executor)
+    if claiming:
+        # The claim landed after we had stopped waiting for it
+        announce_claim(env, ctx, ctx.claim_tx)
+    ctx.identity.acquire()
+    if not pipeline.submit(ctx, stage=stage, block=True):
+        ctx.identity.release()
+        return False
+    log(f"Resuming job {ctx.job_id} at the {stage} stage (journaled: {state['stage']})", "READY")
+    return True
+
+
+def retry_job(env, pipeline, ctx):
+    # A job cleanup_job kept: re-read it from the contract and requeue it where it stopped
+    ctx.identity = None  # released when the job left the pipeline
+    try:
+        ctx.record, ctx.record_at = env.reader.read_job(ctx.chain_job_id), time.time()
+    except Exception as e:
+        log(f"Could not re-read job {ctx.job_id} for a retry: {e}", "WARN")
+        return False
+    state = {"stage": ctx.journaled, "result_hash": ctx.result_hash, "result_size": ctx.result_size}
+    return requeue_job(env, pipeline, ctx, state)
+
+
+def fetch_unclaimed_jobs(client):
+    return client.get("/api/unclaimed-jobs").json()
+
+
+def build_fee_engine(config, web3):
+    return FeeEngine(
+        web3,
+        mode=config.get("fee_mode", "auto"),
+        priority_fee_gwei=config.get("priority_fee_gwei"),
+        max_fee_multiplier=config.get("max_fee_multiplier", 2.0),
+        urgent_tip_multiplier=config.get("claim_tip_multiplier", 2.0),
+        urgent_tip_gwei=config.get("claim_min_tip_gwei"),
+        gas_margin=config.get("gas_limit_margin", 1.2),
+    )
+
+
+def build_scheduler(config, slots, events_mode):
+    return ClaimScheduler(
+        slots,
+        claim_ahead=config.get("claim_ahead", 1),
+        min_interval=config.get("poll_min_interval", config.get("discovery_poll_interval", 2) if events_mode else 1),
+        max_interval=config.get("poll_max_interval", 15),
+        max_backoff=config.get("poll_error_backoff_max", 120),
+    )
+
+
+def build_uploader(config, client):
+    if config.get("result_upload", "chunked") != "chunked":
+        return None
+    return ResultUploader(
+        client,
+        chunk_size=int(config.get("upload_chunk_mb", 4) * MB),
+        compression=config.get("result_compression", "auto"),
+        chunk_timeout=config.get("upload_chunk_timeout", 60),
+    )
+
+
+def build_rewards(config, env, identity):
+    return RewardsService(
+        env.contract, identity.txm, identity.wallet,
+        lambda: check_node_eligibility(env.backend, identity.wallet),
+        min_amount=Web3.to_wei(config.get("reward_withdraw_min_eth", 0.1), "ether"),
+        max_age=config.get("reward_withdraw_max_age_hours", 24) * 3600,
+        check_interval=config.get("reward_check_interval", 300),
+        eligibility_ttl=config.get("eligibility_cache_ttl", 600),
+    )
+
+
+def job_input_size(env, job, probe_budget):
+    # Model + dataset bytes if known from the cache or (within probe_budget) a gateway HEAD
+    def probe(cid):
+        if probe_budget[0] <= 0:
+            return None
+        probe_budget[0] -= 1
+        return env.fetcher.content_length(cid)
+
+    lookup = env.cache.size_of if env.cache is not None else (lambda cid: None)
+    total = 0
+    for cid in (job["model_cid"], job["dataset_cid"]):
+        size = env.scheduler.input_size(cid, lookup, probe)
+        if size is None:
+            return None
+        total += size
+    return total
+
+
+def pick_jobs(env, eligible, capacity):
+    # Ranks validated (job, record) pairs when there are more than the node can take
+    if len(eligible) <= capacity:
+        return eligible
+    probe_budget = [env.scheduler.size_probes]
+    sizes, histories = {}, {}
+    for job, _ in eligible:
+        size = job_input_size(env, job, probe_budget)
+        if size is not None:
+            sizes[job["job_id"]] = size
+        history = env.usage.get(job["model_cid"])
+        if history:
+            histories[job["job_id"]] = history
+    return env.scheduler.rank(eligible, sizes, histories)[:capacity]
+
+
+def submit_jobs(env, pipeline, jobs):
+    # Claims at most as many jobs as the node has room for; returns how many it submitted
+    capacity = env.scheduler.capacity(pipeline)
+    candidates = []
+    for job in jobs:
+        if job.get("chain_job_id") is None:
+            log(f"Job {job['job_id']} has no chain_job_id! Skipping.", "ERR")
+            continue
+        if job["chain_job_id"] not in pipeline:
+            candidates.append(job)
+    if not candidates or capacity == 0:
+        return 0
+
+    # Validate every candidate on-chain in one round trip
+    try:
+        records = env.reader.read_jobs([job["chain_job_id"] for job in candidates])
+    except Exception as e:
+        log(f"Could not read candidate jobs from contract: {e}", "ERR")
+        return 0
+    read_at = time.time()
+
+    eligible = []
+    for job in candidates:
+        job_id, chain_job_id = job["job_id"], job["chain_job_id"]
+        record = records.get(chain_job_id)
+        if record is None:
+            log(f"Job {job_id} skipped: on-chain job index {chain_job_id} out of range or unreadable", "WARN")
+            continue
+        if record.status != STATUS_SUBMITTED:
+            log(f"Job {job_id} skipped: status is not 'Submitted' (status={record.status})", "INFO")
+            if env.feed is not None:
+                env.feed.mark_closed(chain_job_id)
+            continue
+        eligible.append((job, record))
+
+    submitted = 0
+    for job, record in pick_jobs(env, eligible, capacity):
+        identity = assign_identity(env.identities, record)
+        if identity is None:
+            continue  # no wallet's claim policy takes this job right now
+        ctx = JobContext(job)
+        ctx.record, ctx.record_at, ctx.identity = record, read_at, identity
+        identity.acquire()
+        if not pipeline.submit(ctx):
+            # Claim queue is full; the rest will show up again on the next poll
+            identity.release()
+            break
+        submitted += 1
+    return submitted
+
+
+def build_job_feed(config, web3, contract):
+    if config.get("job_discovery", "http") != "events":
+        return None
+    feed = ChainJobFeed(
+        web3, contract,
+        config.get("discovery_cursor_path", "discovery_cursor.json"),
+        confirmations=config.get("discovery_confirmations", 3),
+        start_block=config.get("discovery_start_block"),
+    )
+    log(f"Job discovery: following contract events from block {feed.cursor + 1}", "INFO")
+    return feed
+
+
+def start_metrics(config, env, pipeline):
+    METRICS.gauge("pipeline_queue_depth", lambda: labelled("stage", pipeline.queue_depths()))
+    METRICS.gauge("jobs_in_flight", pipeline.in_flight)
+    METRICS.gauge("jobs_per_hour", lambda: METRICS.count_last_hour("jobs_done"))
+    METRICS.gauge("pending_transactions", lambda: sum(i.txm.pending_count() for i in env.identities))
+    METRICS.gauge("wallet_jobs_in_flight", lambda: labelled("wallet", {i.wallet: i.in_flight() for i in env.identities}))
+    METRICS.gauge("rewards_balance_wei", lambda: labelled(
+        "wallet", {i.wallet: i.rewards.balance for i in env.identities if i.rewards is not None}))
+    METRICS.gauge("outbox_pending", env.outbox.pending_count)
+    if env.retries is not None:
+        METRICS.gauge("jobs_awaiting_retry", lambda: len(env.retries))
+    METRICS.gauge("memory_budget_free_bytes", env.memory.free)
+    if env.warm_pool is not None:
+        METRICS.gauge("warm_executors_ready", env.warm_pool.ready_count)
+    if env.cache is not None:
+        METRICS.gauge("cid_cache", lambda: labelled("stat", env.cache.stats()))
+
+    port = config.get("metrics_port", 9477)
+    if port:
+        host = config.get("metrics_host", "127.0.0.1")
+        try:
+            serve_metrics(METRICS, host, port)
+            log(f"Metrics on http://{host}:{port}/metrics", "INFO")
+        except OSError as e:
+            log(f"Could not start metrics endpoint on {host}:{port}: {e}", "WARN")
+    if config.get("metrics_json_path"):
+        dump_metrics_periodically(METRICS, config["metrics_json_path"], config.get("metrics_dump_interval", 60))
+
+
+def main():
+    config = load_config()
+    set_log_format(config.get("log_format", LOG_FORMAT))
+    api_base, eth_node_url, contract_address, abi_path = (
+        config["api_base"], config["eth_node_url"], config["contract_address"], config["abi_path"]
+    )
+
+    with open(abi_path) as f:
+        abi = json.load(f)["abi"]
+
+    # Only eth_chainId is cached: web3's request validation would otherwise re-read it for
+    # every eth_call and eth_estimateGas
+    web3 = Web3(InstrumentedHTTPProvider(eth_node_url, cache_allowed_requests=True,
+                                         cacheable_requests={"eth_chainId"}))
+    web3.middleware_onion.inject(ExtraDataToPOAMiddleware, layer=0)
+    contract = web3.eth.contract(address=web3.to_checksum_address(contract_address), abi=abi)
+
+    log(f"API base: {api_base}", "INFO")
+
+    backend = BackendClient(api_base, config.get("api_key"))
+    outbox = Outbox(backend, config.get("outbox_path", "outbox.json"))
+    outbox.start()
+
+    # Every wallet gets its own nonce sequence; fee data and gas estimates are shared
+    fees = build_fee_engine(config, web3)
+    identities = []
+    for settings in identity_settings(config):
+        txm = TxManager(web3, settings["wallet_address"], settings["private_key"], fees,
+                        confirm_timeout=config.get("tx_confirm_timeout", 300))
+        txm.start()
+        identities.append(Identity(settings, txm))
+        log(f"Node wallet: {settings['wallet_address']} (node id {settings['node_id']})", "INFO")
+    fetcher = IpfsFetcher(config.get("ipfs_gateways"), read_timeout=config.get("ipfs_read_timeout", 60))
+    reader = ChainReader(web3, contract, eth_node_url)
+    env = NodeEnv(config, web3, contract, reader, identities, fetcher, backend, outbox, build_cid_cache(config))
+    env.uploader = build_uploader(config, backend)
+    slots = execution_slots(config)
+    # cgroup setup moves the node into a leaf group, so it has to precede any subprocess
+    if config.get("job_cgroups", True):
+        env.cgroups = CgroupGovernor()
+    env.memory = build_memory_budget(config, slots)
+    env.warm_pool = build_warm_pool(config, slots)
+    env.journal = JobJournal(config.get("job_journal_path", "job_journal.db"))
+    env.journal.compact()
+    pipeline = build_pipeline(env, slots)
+    pipeline.start()
+    env.retries = RetryQueue(lambda ctx: retry_job(env, pipeline, ctx),
+                             config.get("retry_base_delay", 30), config.get("retry_max_delay", 1800))
+    env.retries.start()
+    start_metrics(config, env, pipeline)
+    start_heartbeat(config, env, pipeline, slots, backend)
+    resume_jobs(env, pipeline)
+    for identity in identities:
+        identity.rewards = build_rewards(config, env, identity)
+        identity.rewards.start()
+
+    env.feed = build_job_feed(config, web3, contract)
+    source = None
+    if env.feed is not None:
+        source = EventJobSource(env.feed, lambda: fetch_unclaimed_jobs(backend),
+                                config.get("http_fallback_interval", 60))
+    env.scheduler = build_scheduler(config, slots, source is not None)
+
+    while True:
+        # A saturated node does not even poll; it wakes up as soon as a slot frees
+        capacity = env.scheduler.capacity(pipeline)
+        if capacity == 0:
+            env.scheduler.sleep(env.scheduler.next_delay(0))
+            continue
+        try:
+            with METRICS.timer("step_seconds", step="poll"):
+                if source is not None:
+                    jobs = source.next_jobs(time.time())
+                else:
+                    jobs = fetch_unclaimed_jobs(backend)
+        except Exception as e:
+            poll_delay = env.scheduler.next_delay(capacity, error=True)
+            log(f"API error: {e} (next poll in {poll_delay:.1f}s)", "ERR")
+            time.sleep(poll_delay)
+            continue
+
+        submit_jobs(env, pipeline, jobs)
+        env.scheduler.sleep(env.scheduler.next_delay(env.scheduler.capacity(pipeline)))
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\n\033[96m[EXIT] Micro Aladdin Node has been shut down safely. 🦁✨\033[0m")
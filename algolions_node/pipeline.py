@@ -0,0 +1,198 @@
+import heapq
+import itertools
+import queue
+import threading
+import time
+from collections import Counter
+
+from algolions_node.metrics import METRICS
+from algolions_node.util import log, log_context
+
+
+class JobContext:
+    # Everything a job accumulates while it moves through the pipeline stages
+    def __init__(self, job):
+        self.job = job
+        self.job_id = job["job_id"]
+        self.chain_job_id = job.get("chain_job_id")
+        self.stage = "queued"  # stage it is queued for or running in
+        self.record = None  # JobRecord read from the contract, and when
+        self.record_at = 0.0
+        self.sandbox = None
+        self.model_path = None
+        self.data_path = None
+        self.output_path = None
+        self.result_hash = None
+        self.result_size = None
+        self.usage = None  # JobUsage of the model run
+        self.identity = None  # executor wallet (Identity) the job is claimed with
+        self.claim_tx = None  # hex hash of our latest claimJob broadcast
+        self.failure = None  # {"fail_reason", "onchain_code"} once the job is being failed
+        self.journaled = None  # last stage written to the job journal
+        self.retries = 0  # times it was put back into the pipeline after stopping part way
+        self.queued_at = time.time()  # when it entered its current stage's queue
+        self.created_at = time.time()
+
+
+class Stage:
+    def __init__(self, name, handler, workers=1, queue_size=1):
+        self.name = name
+        self.handler = handler  # handler(ctx) -> True to pass ctx on, False to drop it
+        self.workers = workers
+        self.queue = queue.Queue(maxsize=queue_size)
+
+
+# Runs jobs through a chain of stages, each with its own workers and bounded input queue.
+# A full downstream queue blocks the upstream workers, so a busy executor naturally
+# stops the node from claiming and downloading more work than it can run.
+class JobPipeline:
+    def __init__(self, stages, on_done=None):
+        self.stages = stages
+        self.on_done = on_done
+        self._active = {}
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def start(self):
+        for idx, stage in enumerate(self.stages):
+            for n in range(stage.workers):
+                t = threading.Thread(target=self._worker, args=(idx,), name=f"{stage.name}-{n}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def stop(self):
+        for stage in self.stages:
+            for _ in range(stage.workers):
+                stage.queue.put(None)
+        for t in self._threads:
+            t.join()
+        self._threads = []
+
+    # Jobs are keyed by chain_job_id, which every discovery source knows
+
+    def submit(self, ctx, stage=None, block=False):
+        # Returns False if the job is already in flight or (non-blocking) the stage is full.
+        # `stage` names the stage to enter at, for jobs resumed part way through.
+        with self._lock:
+            if ctx.chain_job_id in self._active:
+                return False
+            self._active[ctx.chain_job_id] = ctx
+        target = self.stages[0] if stage is None else next(s for s in self.stages if s.name == stage)
+        try:
+            ctx.stage, ctx.queued_at = target.name, time.time()
+            target.queue.put(ctx, block=block)
+            return True
+        except queue.Full:
+            with self._lock:
+                self._active.pop(ctx.chain_job_id, None)
+            return False
+
+    def __contains__(self, chain_job_id):
+        with self._lock:
+            return chain_job_id in self._active
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._active)
+
+    def stage_counts(self):
+        # Jobs per stage, counting both queued and running ones
+        with self._lock:
+            return Counter(ctx.stage for ctx in self._active.values())
+
+    def queue_depths(self):
+        return {stage.name: stage.queue.qsize() for stage in self.stages}
+
+    def _worker(self, idx):
+        stage = self.stages[idx]
+        while True:
+            ctx = stage.queue.get()
+            if ctx is None:
+                return
+            ctx.stage = stage.name
+            started = time.time()
+            METRICS.observe("stage_wait_seconds", started - ctx.queued_at, stage=stage.name)
+            with log_context(job_id=ctx.job_id, chain_job_id=ctx.chain_job_id, stage=stage.name):
+                try:
+                    ok = stage.handler(ctx)
+                except Exception as e:
+                    log(f"Job {ctx.job_id} crashed in {stage.name} stage: {e}", "ERR")
+                    ok = False
+            METRICS.observe("stage_seconds", time.time() - started, stage=stage.name)
+            if ok and idx + 1 < len(self.stages):
+                ctx.stage, ctx.queued_at = self.stages[idx + 1].name, time.time()
+                self.stages[idx + 1].queue.put(ctx)
+            else:
+                self._finish(ctx)
+
+    def _finish(self, ctx):
+        METRICS.observe("job_seconds", time.time() - ctx.created_at, last_stage=ctx.stage)
+        try:
+            if self.on_done:
+                self.on_done(ctx)
+        except Exception as e:
+            log(f"Cleanup failed for job {ctx.job_id}: {e}", "WARN")
+        finally:
+            with self._lock:
+                self._active.pop(ctx.chain_job_id, None)
+
+
+# Jobs that stopped at a stage they can be picked up from again (a completeJob that timed
+# out, a failed upload) wait here and are handed to `handler` after an exponential backoff,
+# so a node that stays up finishes them without a restart.
+class RetryQueue:
+    def __init__(self, handler, base_delay=30, max_delay=1800):
+        self.handler = handler  # handler(ctx) -> False to try again after a longer delay
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._heap = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="retries", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def add(self, ctx):
+        # Returns the delay before the job is handed back
+        ctx.retries += 1
+        delay = min(self.base_delay * 2 ** (ctx.retries - 1), self.max_delay)
+        with self._lock:
+            heapq.heappush(self._heap, (time.time() + delay, next(self._seq), ctx))
+        self._wake.set()
+        return delay
+
+    def __len__(self):
+        with self._lock:
+            return len(self._heap)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            due, delay = [], None
+            with self._lock:
+                now = time.time()
+                while self._heap and self._heap[0][0] <= now:
+                    due.append(heapq.heappop(self._heap)[2])
+                if self._heap:
+                    delay = self._heap[0][0] - now
+            for ctx in due:
+                try:
+                    ok = self.handler(ctx)
+                except Exception as e:
+                    log(f"Retry of job {ctx.job_id} failed: {e}", "WARN")
+                    ok = False
+                if not ok:
+                    self.add(ctx)
+            if not due:
+                self._wake.wait(delay)
+                self._wake.clear()
@@ -0,0 +1,75 @@
+import os
+
+# Memory we assume one model.py run needs when sizing the execution pool
+DEFAULT_JOB_MEMORY_MB = 1024
+
+
+def _read_first_line(path):
+    try:
+        with open(path) as f:
+            return f.readline().strip()
+    except OSError:
+        return None
+
+
+def cpu_budget():
+    # Host CPU count, clamped by the container's cgroup quota (v2 first, then v1)
+    cpus = float(os.cpu_count() or 1)
+    line = _read_first_line("/sys/fs/cgroup/cpu.max")
+    if line:
+        quota, _, period = line.partition(" ")
+        if quota != "max":
+            try:
+                cpus = min(cpus, int(quota) / int(period or 100000))
+            except ValueError:
+                pass
+        return cpus
+    quota = _read_first_line("/sys/fs/cgroup/cpu/cpu.cfs_quota_us")
+    period = _read_first_line("/sys/fs/cgroup/cpu/cpu.cfs_period_us")
+    try:
+        if quota and period and int(quota) > 0:
+            cpus = min(cpus, int(quota) / int(period))
+    except ValueError:
+        pass
+    return cpus
+
+
+def memory_budget():
+    # Bytes of memory available to this container, or None if unbounded/unknown
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        line = _read_first_line(path)
+        if not line or line == "max":
+            continue
+        try:
+            limit = int(line)
+        except ValueError:
+            continue
+        # cgroup v1 reports "unlimited" as a huge page-aligned number
+        if limit < (1 << 60):
+            return limit
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def default_execution_slots(job_memory_mb=DEFAULT_JOB_MEMORY_MB):
+    slots = max(1, int(cpu_budget()))
+    mem = memory_budget()
+    if mem:
+        slots = min(slots, max(1, mem // (job_memory_mb * 1024 * 1024)))
+    return slots
+
+
+def memory_used():
+    # Bytes in use by this container (cgroup), or host-wide used memory outside a cgroup
+    for path in ("/sys/fs/cgroup/memory.current", "/sys/fs/cgroup/memory/memory.usage_in_bytes"):
+        line = _read_first_line(path)
+        if line and line.isdigit():
+            return int(line)
+    try:
+        with open("/proc/meminfo") as f:
+            info = {k: int(v.split()[0]) * 1024 for k, v in (line.split(":", 1) for line in f)}
+        return info["MemTotal"] - info["MemAvailable"]
+    except (OSError, KeyError, ValueError):
+        return None
@@ -0,0 +1,95 @@
+import threading
+import time
+
+from web3.exceptions import ContractLogicError
+
+from algolions_node.metrics import METRICS
+from algolions_node.util import log
+
+
+# Withdraws accrued executor rewards in the background, off the job path. The accrued
+# amount is read from the contract's `balances(wallet)`; a withdrawal is sent only once it
+# reaches `min_amount` wei or has been accruing for `max_age` seconds, and only while the
+# node is eligible (backend check cached for `eligibility_ttl`, then a free eth_call of
+# withdrawRewards so an ineligible node never pays gas for a revert).
+class RewardsService:
+    def __init__(self, contract, txm, wallet, check_eligibility, min_amount, max_age=24 * 3600,
+                 check_interval=300, eligibility_ttl=600, tx_timeout=600):
+        self.contract = contract
+        self.txm = txm
+        self.wallet = wallet
+        self.check_eligibility = check_eligibility  # () -> (eligible, info)
+        self.min_amount = min_amount
+        self.max_age = max_age
+        self.check_interval = check_interval
+        self.eligibility_ttl = eligibility_ttl
+        self.tx_timeout = tx_timeout
+        self.balance = 0
+        self._accruing_since = None
+        self._eligible = None
+        self._eligible_at = 0.0
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="rewards", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def job_paid(self):
+        # A paid job completed; re-check the balance now rather than at the next interval
+        self._wake.set()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                self.check()
+            except Exception as e:
+                log(f"Rewards check failed: {e}", "WARN")
+            self._wake.wait(self.check_interval)
+            self._wake.clear()
+
+    def check(self):
+        self.balance = self.contract.functions.balances(self.wallet).call()
+        if not self.balance:
+            self._accruing_since = None
+            return False
+        if self._accruing_since is None:
+            self._accruing_since = time.time()
+        if self.balance < self.min_amount and time.time() - self._accruing_since < self.max_age:
+            return False
+        if not self._is_eligible():
+            return False
+        return self._withdraw()
+
+    def _is_eligible(self):
+        now = time.time()
+        if self._eligible is None or now - self._eligible_at > self.eligibility_ttl:
+            self._eligible, info = self.check_eligibility()
+            self._eligible_at = now
+            if not self._eligible:
+                log(f"Rewards withdrawal deferred: not eligible. Reason: {info.get('message', 'Check rating/num_ratings on dashboard.')}", "WARN")
+        return self._eligible
+
+    def _withdraw(self):
+        fn = self.contract.functions.withdrawRewards()
+        try:
+            fn.call({"from": self.wallet})
+        except ContractLogicError as e:
+            log(f"Rewards withdrawal would revert ({e}); retrying after {self.eligibility_ttl}s", "WARN")
+            self._eligible, self._eligible_at = False, time.time()
+            return False
+        amount = self.balance
+        receipt = self.txm.submit(fn, 200_000).result(timeout=self.tx_timeout)
+        log(f"✅ Rewards withdrawal of {amount / 1e18:.6f} succeeded! TX: {receipt['transactionHash'].hex()}", "READY")
+        METRICS.inc("rewards_withdrawn_wei_total", amount, wallet=self.wallet)
+        self.balance = 0
+        self._accruing_since = None
+        return True
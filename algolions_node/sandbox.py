@@ -0,0 +1,235 @@
+import os
+import resource
+import signal
+import threading
+
+from algolions_node.util import log
+
+CGROUP_ROOT = "/sys/fs/cgroup"
+MB = 1024 * 1024
+
+# Signals the kernel sends when an rlimit is hit
+LIMIT_SIGNALS = {
+    -signal.SIGXCPU: "CPU time limit",
+    -signal.SIGXFSZ: "file size limit",
+}
+
+
+# --- Per-job rlimits ---
+
+def job_limits(config, cpus, output_limit):
+    # Limits applied to every model process; all values are plain ints so they can be
+    # sent to the warm executor as JSON. A value of 0 leaves that limit unset.
+    memory_mb = config.get("job_memory_mb", 1024)
+    return {
+        # Address space is much larger than RSS for BLAS/pandas, so AS gets headroom;
+        # the cgroup memory.max (when available) is the precise RSS bound.
+        "as_bytes": config.get("job_address_space_mb", 4 * memory_mb) * MB,
+        "memory_bytes": memory_mb * MB,
+        "cpu_seconds": config.get("job_cpu_seconds", int(900 * max(cpus, 1))),
+        "fsize_bytes": output_limit + 1,
+        # Enforced only as cgroup pids.max: RLIMIT_NPROC counts every process and thread of
+        # the uid (the node's own and other jobs'), and root ignores it altogether
+        "nproc": config.get("job_max_procs", 128),
+    }
+
+
+def apply_rlimits(limits, pid=0):
+    # Sets the limits on `pid` (0 = this process); children inherit them
+    for name, key in (("RLIMIT_AS", "as_bytes"), ("RLIMIT_CPU", "cpu_seconds"), ("RLIMIT_FSIZE", "fsize_bytes")):
+        value = limits.get(key)
+        if not value:
+            continue
+        try:
+            if name == "RLIMIT_CPU":
+                # Soft limit delivers SIGXCPU, the hard limit a second later SIGKILL
+                resource.prlimit(pid, resource.RLIMIT_CPU, (value, value + 1))
+            else:
+                resource.prlimit(pid, getattr(resource, name), (value, value))
+        except (ValueError, OSError):
+            pass  # e.g. asking for more than the container's own hard limit
+
+
+# --- Usage accounting ---
+
+class JobUsage:
+    def __init__(self, peak_rss=0, cpu_seconds=0.0, io_read_bytes=0, io_write_bytes=0, oom_killed=False):
+        self.peak_rss = peak_rss
+        self.cpu_seconds = cpu_seconds
+        self.io_read_bytes = io_read_bytes
+        self.io_write_bytes = io_write_bytes
+        self.oom_killed = oom_killed
+
+    @classmethod
+    def from_rusage(cls, ru):
+        # ru_maxrss is KiB on Linux; in/out blocks are 512-byte units
+        return cls(
+            peak_rss=ru.ru_maxrss * 1024,
+            cpu_seconds=ru.ru_utime + ru.ru_stime,
+            io_read_bytes=ru.ru_inblock * 512,
+            io_write_bytes=ru.ru_oublock * 512,
+        )
+
+    def as_dict(self):
+        return {
+            "peak_rss": self.peak_rss,
+            "cpu_seconds": round(self.cpu_seconds, 3),
+            "io_read_bytes": self.io_read_bytes,
+            "io_write_bytes": self.io_write_bytes,
+            "oom_killed": self.oom_killed,
+        }
+
+    def __str__(self):
+        return (f"peak RSS {self.peak_rss // MB}MB, CPU {self.cpu_seconds:.1f}s, "
+                f"read {self.io_read_bytes // MB}MB, wrote {self.io_write_bytes // MB}MB")
+
+
+class UsageHistory:
+    # Recent resource usage per model CID, used to size reservations for repeat models
+    def __init__(self, alpha=0.5):
+        self.alpha = alpha
+        self._lock = threading.Lock()
+        self._by_model = {}
+
+    def record(self, model_cid, usage, wall_time):
+        with self._lock:
+            prev = self._by_model.get(model_cid)
+            if prev is None:
+                self._by_model[model_cid] = {"peak_rss": usage.peak_rss, "wall_time": wall_time, "runs": 1}
+                return
+            # Peak memory keeps the max so a reservation never undershoots a known run
+            prev["peak_rss"] = max(prev["peak_rss"], usage.peak_rss)
+            prev["wall_time"] = self.alpha * wall_time + (1 - self.alpha) * prev["wall_time"]
+            prev["runs"] += 1
+
+    def get(self, model_cid):
+        with self._lock:
+            entry = self._by_model.get(model_cid)
+            return dict(entry) if entry else None
+
+
+class MemoryBudget:
+    # Execution slots only admit a job once its expected memory fits in the node's budget
+    def __init__(self, total_bytes):
+        self.total = total_bytes
+        self.reserved = 0
+        self._cond = threading.Condition()
+
+    def reserve(self, nbytes):
+        nbytes = min(nbytes, self.total)
+        with self._cond:
+            while self.reserved + nbytes > self.total:
+                self._cond.wait()
+            self.reserved += nbytes
+        return nbytes
+
+    def release(self, nbytes):
+        with self._cond:
+            self.reserved -= nbytes
+            self._cond.notify_all()
+
+    def free(self):
+        with self._cond:
+            return self.total - self.reserved
+
+
+# --- cgroup v2 ---
+
+def _write(path, value):
+    with open(path, "w") as f:
+        f.write(value)
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return f.read()
+    except OSError:
+        return ""
+
+
+# Puts each model run in its own cgroup v2 sub-group (memory.max, pids.max and a lower
+# cpu.weight than the node itself) and reads its accounting back after exit. Needs a
+# writable, delegated cgroup2 mount; otherwise `enabled` stays False and only rlimits apply.
+class CgroupGovernor:
+    CONTROLLERS = ("cpu", "memory", "pids", "io")
+
+    def __init__(self, root=CGROUP_ROOT):
+        self.root = root
+        self.enabled = False
+        self.jobs_dir = os.path.join(root, "algolions-jobs")
+        # Only reorganise a cgroup tree we own: the root of a container's cgroup namespace
+        if _read("/proc/self/cgroup").strip() != "0::/":
+            return
+        try:
+            self._setup()
+            self.enabled = True
+        except OSError as e:
+            log(f"cgroup v2 job limits unavailable ({e}); using rlimits only", "INFO")
+
+    def _setup(self):
+        available = _read(os.path.join(self.root, "cgroup.controllers")).split()
+        if not available:
+            raise OSError("no cgroup2 controllers")
+        self.controllers = [c for c in self.CONTROLLERS if c in available]
+        enable = " ".join(f"+{c}" for c in self.controllers)
+        # cgroup v2 forbids processes in a group that delegates controllers, so the node
+        # moves itself into a leaf first.
+        node_dir = os.path.join(self.root, "algolions-node")
+        os.makedirs(node_dir, exist_ok=True)
+        _write(os.path.join(node_dir, "cgroup.procs"), str(os.getpid()))
+        _write(os.path.join(self.root, "cgroup.subtree_control"), enable)
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        _write(os.path.join(self.jobs_dir, "cgroup.subtree_control"), enable)
+
+    def attach(self, name, pid, limits):
+        # Returns the job's cgroup path, or None if it could not be created
+        if not self.enabled:
+            return None
+        path = os.path.join(self.jobs_dir, name)
+        try:
+            os.makedirs(path, exist_ok=True)
+            if "memory" in self.controllers and limits.get("memory_bytes"):
+                _write(os.path.join(path, "memory.max"), str(limits["memory_bytes"]))
+                try:
+                    _write(os.path.join(path, "memory.swap.max"), "0")
+                except OSError:
+                    pass  # swap accounting disabled on this kernel
+            if "pids" in self.controllers and limits.get("nproc"):
+                _write(os.path.join(path, "pids.max"), str(limits["nproc"]))
+            if "cpu" in self.controllers:
+                _write(os.path.join(path, "cpu.weight"), "50")
+                if limits.get("cpus"):
+                    _write(os.path.join(path, "cpu.max"), f"{int(limits['cpus'] * 100000)} 100000")
+            _write(os.path.join(path, "cgroup.procs"), str(pid))
+            return path
+        except OSError as e:
+            log(f"Could not place pid {pid} in cgroup {name}: {e}", "WARN")
+            return None
+
+    def collect(self, path):
+        # Reads accounting for a finished job and removes its cgroup
+        usage = JobUsage()
+        peak = _read(os.path.join(path, "memory.peak")).strip()
+        if peak.isdigit():
+            usage.peak_rss = int(peak)
+        for line in _read(os.path.join(path, "cpu.stat")).splitlines():
+            key, _, value = line.partition(" ")
+            if key == "usage_usec":
+                usage.cpu_seconds = int(value) / 1e6
+        for line in _read(os.path.join(path, "io.stat")).splitlines():
+            for field in line.split()[1:]:
+                key, _, value = field.partition("=")
+                if key == "rbytes":
+                    usage.io_read_bytes += int(value)
+                elif key == "wbytes":
+                    usage.io_write_bytes += int(value)
+        for line in _read(os.path.join(path, "memory.events")).splitlines():
+            key, _, value = line.partition(" ")
+            if key == "oom_kill" and int(value) > 0:
+                usage.oom_killed = True
+        try:
+            os.rmdir(path)
+        except OSError:
+            pass
+        return usage
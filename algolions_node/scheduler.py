@@ -0,0 +1,80 @@
+import random
+import threading
+
+# Pipeline stages in which a job still holds (or is about to take) an execution slot
+CAPACITY_STAGES = ("claim", "fetch", "execute")
+
+
+# Decides how many jobs to claim, which ones, and when to poll next. A node only claims
+# what it can start soon (free execution slots plus a small claim-ahead so inputs are
+# downloaded while the current job runs), prefers paid and short jobs, polls quickly
+# while it has room and backs off while saturated or while the backend is failing.
+class ClaimScheduler:
+    def __init__(self, slots, claim_ahead=1, min_interval=1.0, max_interval=15.0, max_backoff=120.0,
+                 jitter=0.2, default_runtime=60.0, bandwidth=10 * 1024 * 1024, size_probes=8):
+        self.slots = slots
+        self.claim_ahead = claim_ahead
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.default_runtime = default_runtime  # seconds assumed for a model never run here
+        self.bandwidth = bandwidth  # bytes/sec assumed when turning input size into time
+        self.size_probes = size_probes  # max uncached input sizes looked up per poll
+        self._errors = 0
+        self._saturated_delay = min_interval
+        self._sizes = {}
+        self._wake = threading.Event()
+
+    def capacity(self, pipeline):
+        busy = sum(n for stage, n in pipeline.stage_counts().items() if stage in CAPACITY_STAGES)
+        return max(self.slots + self.claim_ahead - busy, 0)
+
+    def next_delay(self, capacity, error=False):
+        if error:
+            self._errors += 1
+            delay = min(self.min_interval * 2 ** self._errors, self.max_backoff)
+        elif capacity > 0:
+            self._errors = 0
+            self._saturated_delay = self.min_interval
+            delay = self.min_interval
+        else:
+            # Saturated: each further poll waits longer, until a slot frees up
+            self._errors = 0
+            self._saturated_delay = min(self._saturated_delay * 2, self.max_interval)
+            delay = self._saturated_delay
+        # Jitter keeps a fleet of nodes from polling and claiming in lockstep
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def sleep(self, delay):
+        # Returns early when capacity_freed() is called
+        self._wake.wait(delay)
+        self._wake.clear()
+
+    def capacity_freed(self):
+        self._wake.set()
+
+    def input_size(self, cid, lookup, probe):
+        # lookup(cid) is cheap (local cache), probe(cid) costs a request; CIDs are immutable
+        if cid in self._sizes:
+            return self._sizes[cid]
+        size = lookup(cid)
+        if size is None and probe is not None:
+            size = probe(cid)
+        if size is not None:
+            if len(self._sizes) > 10000:
+                self._sizes.clear()
+            self._sizes[cid] = size
+        return size
+
+    def estimate_seconds(self, input_bytes, history):
+        runtime = history["wall_time"] if history else self.default_runtime
+        return runtime + (input_bytes or 0) / self.bandwidth
+
+    def rank(self, candidates, sizes, histories):
+        # candidates: [(job, record)]; sizes/histories map job_id -> bytes / UsageHistory entry.
+        # Paid jobs first, then shortest expected time to finish.
+        def key(item):
+            job, record = item
+            return (not record.paid, self.estimate_seconds(sizes.get(job["job_id"]), histories.get(job["job_id"])))
+        return sorted(candidates, key=key)
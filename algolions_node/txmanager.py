@@ -0,0 +1,207 @@
+import threading
+import time
+from concurrent.futures import Future
+
+from web3.exceptions import TransactionNotFound
+
+from algolions_node.fees import FeeEngine
+from algolions_node.metrics import METRICS
+from algolions_node.util import log
+
+
+class TransactionReverted(Exception):
+    def __init__(self, label, receipt):
+        super().__init__(f"{label} reverted in block {receipt.get('blockNumber')}")
+        self.receipt = receipt
+
+
+class TransactionReplaced(Exception):
+    pass
+
+
+class TransactionTimeout(TimeoutError):
+    pass
+
+
+def raw_transaction(signed_tx):
+    # Try both attribute names for compatibility across eth-account versions
+    raw_tx = getattr(signed_tx, 'raw_transaction', None) or getattr(signed_tx, 'rawTransaction', None)
+    if raw_tx is None:
+        raise AttributeError(f"SignedTransaction has no 'rawTransaction' or 'raw_transaction'. Found: {dir(signed_tx)}")
+    return raw_tx
+
+
+class PendingTx:
+    def __init__(self, label, nonce, tx, tx_hash, method=None, urgent=False):
+        self.label = label
+        self.method = method or label
+        self.urgent = urgent
+        self.nonce = nonce
+        self.tx = tx
+        self.hashes = [tx_hash]
+        self.created_at = self.sent_at = time.time()
+        self.bumps = 0
+        self.future = Future()
+        # Latest broadcast hash, updated on fee bumps
+        self.future.tx_hash = tx_hash
+
+
+# Owns the wallet's nonce locally so several transactions can be in flight at once.
+# submit() returns as soon as the tx is broadcast; a monitor thread resolves the
+# returned Future with the receipt, re-broadcasts stuck txs with a higher fee and
+# fails the Future if the nonce was taken by some other transaction, or if the tx is
+# still not mined after `confirm_timeout` seconds or after its last fee bump.
+class TxManager:
+    def __init__(self, web3, wallet, private_key, fees=None, poll_interval=1.0, stuck_after=90,
+                 urgent_stuck_after=15, fee_bump=1.125, max_bumps=5, confirm_timeout=300):
+        self.web3 = web3
+        self.wallet = wallet
+        self.private_key = private_key
+        self.fees = fees or FeeEngine(web3)
+        self.poll_interval = poll_interval
+        self.stuck_after = stuck_after
+        self.urgent_stuck_after = urgent_stuck_after  # claim races are lost long before stuck_after
+        self.fee_bump = fee_bump
+        self.max_bumps = max_bumps
+        self.confirm_timeout = confirm_timeout
+        self._nonce = None
+        self._chain_id = None  # read once; it never changes for a connection
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._monitor, name="tx-monitor", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def resync_nonce(self):
+        with self._lock:
+            self._nonce = None
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._pending)
+
+    def submit(self, fn, gas, label=None):
+        # `gas` is the fallback limit when the method's gas cannot be estimated. Raises if the
+        # call would revert or the broadcast itself fails; the local nonce is then resynced
+        # from the chain on the next submit.
+        method = fn.fn_name
+        label = label or method
+        if self._chain_id is None:
+            self._chain_id = self.web3.eth.chain_id
+        # With chainId given, neither the estimate nor build_transaction asks the node for it
+        params = {"from": self.wallet, "chainId": self._chain_id}
+        gas = self.fees.gas_limit(fn, method, params, gas)
+        fee_fields = self.fees.fee_fields(method)
+        with self._lock:
+            if self._nonce is None:
+                self._nonce = self.web3.eth.get_transaction_count(self.wallet, "pending")
+            nonce = self._nonce
+            tx = fn.build_transaction({**params, "nonce": nonce, "gas": gas, **fee_fields})
+            try:
+                tx_hash = self._send(tx)
+            except Exception:
+                self._nonce = None
+                raise
+            self._nonce = nonce + 1
+            pending = PendingTx(label, nonce, tx, tx_hash, method, self.fees.is_urgent(method))
+            self._pending[nonce] = pending
+        self.start()
+        return pending.future
+
+    def _send(self, tx):
+        signed_tx = self.web3.eth.account.sign_transaction(tx, private_key=self.private_key)
+        return self.web3.eth.send_raw_transaction(raw_transaction(signed_tx))
+
+    def _monitor(self):
+        while not self._stopped.wait(self.poll_interval):
+            with self._lock:
+                pending = list(self._pending.values())
+            if not pending:
+                continue
+            try:
+                # Read the mined nonce before the receipts: if it has moved past a tx and
+                # none of our hashes for that nonce has a receipt, the nonce was used elsewhere.
+                mined_nonce = self.web3.eth.get_transaction_count(self.wallet, "latest")
+            except Exception as e:
+                log(f"Tx monitor could not read nonce: {e}", "WARN")
+                continue
+            for p in pending:
+                try:
+                    self._check(p, mined_nonce)
+                except Exception as e:
+                    log(f"Tx monitor error for {p.label} (nonce {p.nonce}): {e}", "WARN")
+
+    def _check(self, p, mined_nonce):
+        for tx_hash in p.hashes:
+            try:
+                receipt = self.web3.eth.get_transaction_receipt(tx_hash)
+            except TransactionNotFound:
+                continue
+            if receipt is None:
+                continue
+            self._resolve(p)
+            if receipt.get("status", 1) == 0:
+                p.future.set_exception(TransactionReverted(p.label, receipt))
+            else:
+                p.future.set_result(receipt)
+            self._account(p, receipt)
+            return
+        if mined_nonce > p.nonce:
+            self._resolve(p)
+            self.resync_nonce()
+            p.future.set_exception(TransactionReplaced(
+                f"{p.label} (nonce {p.nonce}) was replaced by another transaction"))
+            return
+        stuck_after = self.urgent_stuck_after if p.urgent else self.stuck_after
+        now = time.time()
+        if now - p.created_at > self.confirm_timeout or (p.bumps >= self.max_bumps and now - p.sent_at > stuck_after):
+            # Give up on it; the next submit re-reads the nonce, reusing this one if the tx was dropped
+            self._resolve(p)
+            self.resync_nonce()
+            METRICS.inc("transactions_total", method=p.label, outcome="timeout")
+            p.future.set_exception(TransactionTimeout(
+                f"{p.label} (nonce {p.nonce}) not mined after {now - p.created_at:.0f}s and {p.bumps} fee bump(s)"))
+            return
+        if now - p.sent_at > stuck_after:
+            self._bump(p)
+
+    def _bump(self, p):
+        tx = self.fees.bump(p.tx, self.fee_bump)
+        try:
+            tx_hash = self._send(tx)
+        except Exception as e:
+            # "already known"/"nonce too low" mean the original is about to land
+            log(f"Fee bump for {p.label} (nonce {p.nonce}) rejected: {e}", "WARN")
+            p.sent_at = time.time()
+            return
+        p.tx = tx
+        p.hashes.append(tx_hash)
+        p.future.tx_hash = tx_hash
+        p.bumps += 1
+        p.sent_at = time.time()
+        fee = tx.get("maxPriorityFeePerGas", tx.get("gasPrice"))
+        log(f"{p.label} (nonce {p.nonce}) stuck; re-sent with fee {fee}, tx hash: {tx_hash.hex()}", "WARN")
+
+    def _account(self, p, receipt):
+        gas_used = receipt.get("gasUsed", 0)
+        price = receipt.get("effectiveGasPrice") or p.tx.get("maxFeePerGas") or p.tx["gasPrice"]
+        self.fees.record_receipt(p.method, receipt, p.tx["gas"])
+        outcome = "reverted" if receipt.get("status", 1) == 0 else "ok"
+        METRICS.inc("transactions_total", method=p.label, outcome=outcome)
+        METRICS.inc("gas_used_total", gas_used, method=p.label)
+        METRICS.inc("gas_spent_wei_total", gas_used * price, method=p.label)
+        METRICS.observe("transaction_confirm_seconds", time.time() - p.created_at, method=p.label)
+
+    def _resolve(self, p):
+        with self._lock:
+            self._pending.pop(p.nonce, None)
@@ -0,0 +1,153 @@
+import gzip
+import os
+import random
+import shutil
+import time
+
+import requests
+
+from algolions_node.metrics import METRICS
+from algolions_node.util import log
+
+try:
+    import zstandard
+except ImportError:  # optional; gzip is used without it
+    zstandard = None
+
+UPLOADS_PATH = "/api/result-uploads/"
+
+
+class ChunkedUploadUnavailable(Exception):
+    # The backend has no chunked upload endpoint; use the single multipart POST instead
+    pass
+
+
+def looks_like_text(path, sample_size=64 * 1024):
+    with open(path, "rb") as f:
+        sample = f.read(sample_size)
+    if b"\0" in sample:
+        return False
+    try:
+        sample.decode("utf-8")
+    except UnicodeDecodeError as e:
+        # A multi-byte character cut off by the end of the sample is still text
+        return e.start >= len(sample) - 3
+    return True
+
+
+def compress_file(path, encoding):
+    # Streams `path` into a compressed sibling file. Output is deterministic (no gzip
+    # mtime), so an upload resumed after a restart sends exactly the same bytes.
+    out_path = f"{path}.{'zst' if encoding == 'zstd' else 'gz'}"
+    with open(path, "rb") as src, open(out_path, "wb") as dst:
+        if encoding == "zstd":
+            zstandard.ZstdCompressor(level=3).copy_stream(src, dst)
+        else:
+            with gzip.GzipFile(fileobj=dst, mode="wb", compresslevel=6, mtime=0) as gz:
+                shutil.copyfileobj(src, gz, 1024 * 1024)
+    return out_path
+
+
+# Uploads job results to the backend in fixed-size chunks. The upload session is keyed
+# by job id and result hash, so creating it again (after a failed attempt or a restart)
+# returns the offset the backend already holds and only the rest is sent. Every chunk is
+# retried on its own with backoff. Text results are compressed first, and the backend
+# checks the decoded file against the SHA-256 that completeJob put on-chain.
+#
+#   POST {UPLOADS_PATH}                      {job_id, wallet_address, sha256, size,
+#                                             encoding, encoded_size} -> {upload_id, offset}
+#   POST {UPLOADS_PATH}<upload_id>/chunk     raw bytes, Upload-Offset header -> {offset}
+#                                            (409 with the backend's offset on a mismatch)
+#   POST {UPLOADS_PATH}<upload_id>/complete  -> 200 once the hash matches
+class ResultUploader:
+    def __init__(self, client, chunk_size=4 * 1024 * 1024, compression="auto", min_compress_size=64 * 1024,
+                 max_attempts=8, base_delay=1.0, max_delay=60.0, chunk_timeout=60):
+        self.client = client
+        self.chunk_size = chunk_size
+        # "auto" picks zstd when installed, else gzip; "none" disables compression
+        if compression == "auto":
+            compression = "zstd" if zstandard is not None else "gzip"
+        elif compression == "zstd" and zstandard is None:
+            log("zstandard is not installed; compressing results with gzip", "WARN")
+            compression = "gzip"
+        self.compression = compression
+        self.min_compress_size = min_compress_size
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.chunk_timeout = chunk_timeout
+        self.available = True  # cleared once the backend answers 404 to session creation
+
+    def _encode(self, path, size):
+        if self.compression == "none" or size < self.min_compress_size or not looks_like_text(path):
+            return path, "identity"
+        encoded = compress_file(path, self.compression)
+        if os.path.getsize(encoded) >= size * 0.9:
+            os.remove(encoded)
+            return path, "identity"
+        return encoded, self.compression
+
+    def _retrying(self, what, fn):
+        # Runs fn() until it returns a response the backend accepted or answered for sure
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                r = fn()
+                if r.status_code < 500 and r.status_code != 429:
+                    return r
+                error = f"HTTP {r.status_code}"
+            except requests.RequestException as e:
+                error = str(e)
+            if attempt == self.max_attempts:
+                raise IOError(f"{what} failed after {attempt} attempts: {error}")
+            delay = min(self.base_delay * 2 ** (attempt - 1), self.max_delay) * random.uniform(0.5, 1.0)
+            METRICS.inc("upload_retries_total")
+            log(f"{what} failed ({error}); retrying in {delay:.1f}s", "WARN")
+            time.sleep(delay)
+
+    def upload(self, job_id, wallet, path, sha256, size):
+        # Raises ChunkedUploadUnavailable or IOError; returns the encoding used
+        if not self.available:
+            raise ChunkedUploadUnavailable()
+        send_path, encoding = self._encode(path, size)
+        try:
+            encoded_size = os.path.getsize(send_path)
+            r = self._retrying(f"Upload session for job {job_id}", lambda: self.client.post(
+                UPLOADS_PATH, auth=True, endpoint=UPLOADS_PATH, json={
+                    "job_id": job_id, "wallet_address": wallet, "sha256": sha256, "size": size,
+                    "encoding": encoding, "encoded_size": encoded_size}))
+            if r.status_code in (404, 405):
+                self.available = False
+                raise ChunkedUploadUnavailable()
+            if not r.ok:
+                raise IOError(f"Upload session for job {job_id} rejected ({r.status_code}): {r.text.strip()}")
+            session = r.json()
+            upload_id, offset = session["upload_id"], session.get("offset", 0)
+            if offset:
+                log(f"Resuming upload for job {job_id} at byte {offset}/{encoded_size}", "INFO")
+            self._send_chunks(job_id, upload_id, send_path, offset, encoded_size)
+            r = self._retrying(f"Upload completion for job {job_id}", lambda: self.client.post(
+                f"{UPLOADS_PATH}{upload_id}/complete", auth=True, endpoint=f"{UPLOADS_PATH}complete"))
+            if not r.ok:
+                raise IOError(f"Backend rejected upload for job {job_id} ({r.status_code}): {r.text.strip()}")
+            return encoding
+        finally:
+            if send_path != path:
+                os.remove(send_path)
+
+    def _send_chunks(self, job_id, upload_id, path, offset, total):
+        with open(path, "rb") as f:
+            while offset < total:
+                f.seek(offset)
+                chunk = f.read(self.chunk_size)
+                r = self._retrying(f"Upload chunk at {offset} for job {job_id}", lambda: self.client.post(
+                    f"{UPLOADS_PATH}{upload_id}/chunk", data=chunk, auth=True, timeout=self.chunk_timeout,
+                    endpoint=f"{UPLOADS_PATH}chunk",
+                    headers={"Upload-Offset": str(offset), "Content-Type": "application/octet-stream"}))
+                if r.status_code == 409:
+                    # Backend holds a different offset (e.g. a chunk whose response was lost)
+                    offset = r.json()["offset"]
+                    continue
+                if not r.ok:
+                    raise IOError(f"Upload chunk at {offset} for job {job_id} rejected ({r.status_code}): {r.text.strip()}")
+                METRICS.inc("uploaded_bytes_total", len(chunk), dest="backend")
+                offset = r.json().get("offset", offset + len(chunk))
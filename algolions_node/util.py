@@ -0,0 +1,47 @@
+import json
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+# "text" (colored, human-readable) or "json" (one object per line)
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "text")
+
+# Job/stage fields of the work the current thread is doing, attached to JSON log lines
+_context = threading.local()
+
+
+def set_log_format(fmt):
+    global LOG_FORMAT
+    LOG_FORMAT = fmt
+
+
+@contextmanager
+def log_context(**fields):
+    previous = getattr(_context, "fields", {})
+    _context.fields = {**previous, **fields}
+    try:
+        yield
+    finally:
+        _context.fields = previous
+
+
+def log(msg, level="INFO"):
+    if LOG_FORMAT == "json":
+        entry = {"ts": datetime.now().isoformat(timespec="milliseconds"), "level": level,
+                 **getattr(_context, "fields", {}), "msg": msg}
+        print(json.dumps(entry, default=str), flush=True)
+        return
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    color = {"INFO": "\033[92m", "WARN": "\033[93m", "ERR": "\033[91m", "READY": "\033[96m"}
+    print(f"{color.get(level, '')}[{now}][{level}] {msg}\033[0m", flush=True)
+
+
+def save_json_atomic(path, data):
+    # Write-then-rename so a crash never leaves a half-written file behind
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
@@ -0,0 +1,125 @@
+# Warm executor process: imports the heavy ML libraries once, then forks a fresh child
+# per job that runs model.py exactly as `python model.py data.csv output` would.
+#
+# Protocol (one JSON object per line): the node writes
+#   {"argv": [model_path, data_path, output_path], "limits": {...}}
+# to stdin; the zygote answers {"pid": <child pid>} once the child is forked and
+# {"exit": <returncode>, "usage": {...}} when it has finished. A returncode of -N
+# means killed by signal N.
+import atexit
+import gc
+import importlib
+import io
+import json
+import os
+import runpy
+import signal
+import sys
+import threading
+import traceback
+
+from algolions_node.sandbox import JobUsage, apply_rlimits
+
+DEFAULT_PRELOAD = ["numpy", "pandas", "scipy", "sklearn", "statsmodels.api"]
+
+
+def preload(modules):
+    loaded, failed = [], []
+    for name in modules:
+        try:
+            importlib.import_module(name)
+            loaded.append(name)
+        except Exception:
+            failed.append(name)
+    return loaded, failed
+
+
+def reseed():
+    # Children must not share the zygote's RNG state; a cold interpreter would start fresh
+    import random
+    random.seed()
+    np = sys.modules.get("numpy")
+    if np is not None:
+        np.random.seed()
+
+
+def run_child(argv, limits):
+    os.setsid()
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGPIPE, signal.SIG_DFL)
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for fd in (0, 1, 2):
+        os.dup2(devnull, fd)
+    os.closerange(3, 1024)
+    apply_rlimits(limits)
+    reseed()
+
+    model_path = argv[0]
+    sys.argv = list(argv)
+    sys.path[0] = os.path.dirname(os.path.abspath(model_path))
+    code = 0
+    try:
+        runpy.run_path(model_path, run_name="__main__")
+    except SystemExit as e:
+        if e.code is None:
+            code = 0
+        elif isinstance(e.code, int):
+            code = e.code
+        else:
+            code = 1
+    except BaseException:
+        traceback.print_exc()
+        code = 1
+    try:
+        finish_child()
+    finally:
+        os._exit(code & 0xFF)
+
+
+def finish_child():
+    # os._exit skips interpreter shutdown, so do its work here as a cold `python model.py`
+    # would: wait for non-daemon threads, run atexit hooks and flush every file the model
+    # left open. Flushed before collecting them, since gc can finalize a text file's
+    # buffer ahead of the wrapper and drop whatever the wrapper still held.
+    current = threading.current_thread()
+    for t in threading.enumerate():
+        if t is not current and not t.daemon:
+            t.join()
+    atexit._run_exitfuncs()
+    for obj in gc.get_objects():
+        if isinstance(obj, io.IOBase):
+            try:
+                if not obj.closed:
+                    obj.flush()
+            except (OSError, ValueError):
+                pass
+    gc.collect()
+
+
+def returncode_from_status(status):
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def main():
+    loaded, failed = preload(sys.argv[1:] or DEFAULT_PRELOAD)
+    out = sys.stdout
+    out.write(json.dumps({"ready": True, "loaded": loaded, "failed": failed}) + "\n")
+    out.flush()
+    for line in sys.stdin:
+        request = json.loads(line)
+        pid = os.fork()
+        if pid == 0:
+            run_child(request["argv"], request.get("limits") or {})
+        out.write(json.dumps({"pid": pid}) + "\n")
+        out.flush()
+        _, status, ru = os.wait4(pid, 0)
+        usage = JobUsage.from_rusage(ru).as_dict()
+        out.write(json.dumps({"exit": returncode_from_status(status), "usage": usage}) + "\n")
+        out.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# Compares job start-up cost of the cold `python model.py` path against the warm pool.
+#
+#   python -m benchmarks.executor_startup [runs]
+#
+# The model imports the same libraries the warm executor preloads, then writes a tiny
+# result, so the measured time is almost entirely interpreter start + imports. Both paths
+# also run a model that relies on interpreter shutdown (a file it never closes, an atexit
+# hook), and their outputs must match.
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from algolions_node.executor import WarmPool, run_model
+from algolions_node.zygote import DEFAULT_PRELOAD
+
+MODEL = """
+import sys
+import numpy, pandas, scipy, sklearn, statsmodels.api
+df = pandas.read_csv(sys.argv[1])
+with open(sys.argv[2], "w") as f:
+    f.write(str(numpy.sum(df.values)))
+"""
+
+# Leaves its output open and registers an atexit hook; a function keeps the module's
+# namespace in a reference cycle, so only a proper shutdown flushes the file
+SHUTDOWN_MODEL = """
+import atexit
+import sys
+out = open(sys.argv[2], "w")
+out.write("0123456789")
+def result():
+    return out
+atexit.register(lambda: out.write(" atexit"))
+"""
+
+
+def measure(runs, workdir, pool=None):
+    model_path = os.path.join(workdir, "model.py")
+    data_path = os.path.join(workdir, "data.csv")
+    times = []
+    for i in range(runs):
+        output_path = os.path.join(workdir, f"out_{'warm' if pool else 'cold'}_{i}")
+        result = run_model(model_path, data_path, output_path, poll_interval=0.01, pool=pool)
+        if not result.ok:
+            raise SystemExit(f"model run failed: returncode={result.returncode}")
+        times.append(result.wall_time)
+    return times
+
+
+def check_shutdown(workdir, pool):
+    model_path = os.path.join(workdir, "shutdown_model.py")
+    with open(model_path, "w") as f:
+        f.write(SHUTDOWN_MODEL)
+    outputs = {}
+    for name, p in (("cold", None), ("warm", pool)):
+        output_path = os.path.join(workdir, f"shutdown_{name}")
+        result = run_model(model_path, os.path.join(workdir, "data.csv"), output_path, poll_interval=0.01, pool=p)
+        with open(output_path, "rb") as f:
+            outputs[name] = (result.returncode, f.read())
+    if outputs["cold"] != outputs["warm"]:
+        raise SystemExit(f"warm and cold runs differ: cold={outputs['cold']} warm={outputs['warm']}")
+    print(f"shutdown check: both paths exited {outputs['cold'][0]} with {outputs['cold'][1]!r}")
+
+
+def report(name, times):
+    print(f"{name:>5}: mean {statistics.mean(times):.3f}s  median {statistics.median(times):.3f}s  "
+          f"min {min(times):.3f}s  max {max(times):.3f}s  (n={len(times)})")
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    with tempfile.TemporaryDirectory() as workdir:
+        with open(os.path.join(workdir, "model.py"), "w") as f:
+            f.write(MODEL)
+        with open(os.path.join(workdir, "data.csv"), "w") as f:
+            f.write("a,b\n1,2\n3,4\n")
+
+        cold = measure(runs, workdir)
+
+        pool = WarmPool(1, DEFAULT_PRELOAD)
+        pool.start()
+        deadline = time.time() + 180
+        while pool.ready_count() == 0 and time.time() < deadline:
+            time.sleep(0.1)
+        if pool.ready_count() == 0:
+            raise SystemExit("warm executor did not become ready")
+        warm = measure(runs, workdir, pool)
+        check_shutdown(workdir, pool)
+        pool.stop()
+
+    report("cold", cold)
+    report("warm", warm)
+    print(f"speedup: {statistics.median(cold) / statistics.median(warm):.1f}x (median)")
+
+
+if __name__ == "__main__":
+    main()
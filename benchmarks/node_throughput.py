@@ -0,0 +1,574 @@
+# End-to-end throughput of a real node process, fully offline. The node runs unmodified
+# (`python -m algolions_node.node`) against local stand-ins:
+#   - an in-process EVM (eth-tester) with JobLogger.json deployed, served over JSON-RPC
+#   - a stub backend implementing every endpoint the node calls
+#   - a fake IPFS gateway serving generated models and datasets
+#
+#   python -m benchmarks.node_throughput [--workload tiny|huge|failures|paid] [--jobs N]
+#       [--dataset-mb MB] [--wallets N] [--set key=value ...] [--repo PATH] [--json out.json]
+#
+# Workloads: "tiny" is many small jobs, "huge" a few large datasets, "failures" a mix of
+# crashing models, missing inputs and successful jobs, "paid" interleaves paid and unpaid
+# jobs (paid completions and failures cost more gas than unpaid ones). --set overrides node_config.json
+# keys (values are parsed as JSON), and --repo runs the node from another checkout, so
+# two versions or settings can be compared on the same workload. --wallets N registers N
+# executor wallets and runs them as identities of one node process.
+#
+# Reports jobs/sec, per-stage and per-step latency percentiles (from the node's
+# /metrics.json), peak RSS of the node and of the model processes, and RPC call counts.
+# Needs eth-tester: pip install "eth-tester[py-evm]"
+import argparse
+import base64
+import gzip
+import hashlib
+import json
+import os
+import re
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+from web3 import EthereumTesterProvider, Web3
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ABI_PATH = os.path.join(REPO_ROOT, "JobLogger.json")
+
+MODEL_OK = """
+import sys
+import pandas
+df = pandas.read_csv(sys.argv[1])
+with open(sys.argv[2], "w") as f:
+    f.write(str(df.sum(numeric_only=True).sum()))
+"""
+
+MODEL_FAIL = """
+import sys
+sys.exit(1)
+"""
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def serve(handler):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def raw_cid(content_sha256):
+    # CIDv1, raw codec, sha2-256, base32: the node's cache can verify these
+    raw = bytes([0x01, 0x55, 0x12, 0x20]) + content_sha256
+    return "b" + base64.b32encode(raw).decode().lower().rstrip("=")
+
+
+# --- Local chain ---
+
+def _camel(key):
+    head, *rest = key.split("_")
+    return head + "".join(part.title() for part in rest)
+
+
+def _to_rpc(value):
+    # eth-tester answers with Python values and snake_case keys; JSON-RPC wants hex and camelCase
+    if isinstance(value, bool) or value is None or isinstance(value, str):
+        return value
+    if isinstance(value, int):
+        return hex(value)
+    if isinstance(value, (bytes, bytearray)):
+        return "0x" + bytes(value).hex()
+    if isinstance(value, dict):
+        return {_camel(k): _to_rpc(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_rpc(v) for v in value]
+    return str(value)
+
+
+class LocalChain:
+    def __init__(self, wallets=1):
+        self.w3 = Web3(EthereumTesterProvider())
+        self.lock = threading.Lock()
+        self.calls = Counter()
+        with open(ABI_PATH) as f:
+            artifact = json.load(f)
+        self.owner = self.w3.eth.accounts[0]
+        factory = self.w3.eth.contract(abi=artifact["abi"], bytecode=artifact["bytecode"])
+        tx = factory.constructor().transact({"from": self.owner})
+        address = self.w3.eth.wait_for_transaction_receipt(tx).contractAddress
+        self.contract = self.w3.eth.contract(address=address, abi=artifact["abi"])
+        self.node_accounts = [self.w3.eth.account.create() for _ in range(wallets)]
+        for account in self.node_accounts:
+            self.w3.eth.send_transaction({"from": self.owner, "to": account.address, "value": 10 ** 21})
+            self.contract.functions.registerExecutor(account.address).transact({"from": self.owner})
+        # Submitter balance for paid jobs
+        self.contract.functions.deposit().transact({"from": self.owner, "value": 10 ** 20})
+        self.node_account = self.node_accounts[0]
+        self.server, self.url = serve(self._handler())
+
+    def submit_job(self, model_cid, data_cid, paid=False):
+        with self.lock:
+            self.contract.functions.submitJob(model_cid, data_cid, paid).transact({"from": self.owner})
+            return self.contract.functions.jobCount().call() - 1
+
+    def finished_jobs(self, from_block):
+        # {chain_job_id: "completed"|"failed"} from logs since from_block, and the next block to scan
+        with self.lock:
+            head = self.w3.eth.block_number
+            finished = {}
+            if head >= from_block:
+                for event, outcome in (("JobCompleted", "completed"), ("JobFailed", "failed")):
+                    for entry in getattr(self.contract.events, event).get_logs(from_block=from_block, to_block=head):
+                        finished[entry["args"]["jobId"]] = outcome
+        return finished, head + 1
+
+    def _call(self, request):
+        method, params = request.get("method"), list(request.get("params") or [])
+        self.calls[method] += 1
+        if method == "eth_call" and params and "from" not in params[0]:
+            params[0] = {**params[0], "from": self.owner}
+        try:
+            with self.lock:
+                response = dict(self.w3.provider.make_request(method, params))
+        except Exception as e:
+            response = {"error": {"code": -32000, "message": str(e)}}
+        if "result" in response:
+            response["result"] = _to_rpc(response["result"])
+        if "error" in response and not isinstance(response["error"], dict):
+            response["error"] = {"code": -32000, "message": str(response["error"])}
+        response.update(jsonrpc="2.0", id=request.get("id"))
+        return response
+
+    def _handler(self):
+        chain = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                if isinstance(body, list):
+                    chain.calls["(batch)"] += 1
+                    out = [chain._call(r) for r in body]
+                else:
+                    out = chain._call(body)
+                data = json.dumps(out).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+# --- Stub backend ---
+
+class StubBackend:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.jobs = {}
+        self.claimed = set()
+        self.claims_by_wallet = Counter()
+        self.results = {}
+        self.failures = {}
+        self.calls = Counter()
+        self.upload_bytes = 0
+        self.uploads = {}  # upload_id -> session of a chunked result upload
+        self.server, self.url = serve(self._handler())
+
+    def add_job(self, job_id, chain_job_id, model_cid, dataset_cid):
+        with self.lock:
+            self.jobs[job_id] = {"job_id": job_id, "chain_job_id": chain_job_id,
+                                 "model_cid": model_cid, "dataset_cid": dataset_cid}
+
+    def _unclaimed(self):
+        with self.lock:
+            return [j for job_id, j in self.jobs.items()
+                    if job_id not in self.claimed and job_id not in self.failures]
+
+    def _handler(self):
+        backend = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _reply(self, payload, code=200):
+                data = json.dumps(payload).encode()
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                path = self.path.split("?")[0]
+                backend.calls[f"GET {re.sub(r'/[^/]+$', '/<id>', path) if 'eligibility' in path else path}"] += 1
+                if path == "/api/unclaimed-jobs":
+                    self._reply(backend._unclaimed())
+                elif path.startswith("/api/node-eligibility/"):
+                    self._reply({"eligible": False, "message": "benchmark"})
+                else:
+                    self._reply({"error": "not found"}, 404)
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                path = self.path.split("?")[0]
+                backend.calls[f"POST {re.sub(r'/result-uploads/[^/]+/', '/result-uploads/<id>/', path)}"] += 1
+                if path.startswith("/api/result-uploads/"):
+                    code, payload = backend._result_upload(path, self.headers, body)
+                    self._reply(payload, code)
+                    return
+                form = {}
+                if self.headers.get("Content-Type", "").startswith("application/x-www-form-urlencoded"):
+                    form = {k: v[0] for k, v in parse_qs(body.decode()).items()}
+                now = time.time()
+                with backend.lock:
+                    if path == "/claim-job/":
+                        backend.claimed.add(form.get("job_id"))
+                        backend.claims_by_wallet[form.get("wallet_address")] += 1
+                    elif path == "/fail-job/":
+                        backend.failures.setdefault(form.get("job_id"), now)
+                    elif path == "/api/submit-result/":
+                        match = re.search(rb'name="job_id"\r\n\r\n([^\r]*)', body)
+                        if match:
+                            backend.results.setdefault(match.group(1).decode(), now)
+                        backend.upload_bytes += len(body)
+                self._reply({"ok": True})
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def _result_upload(self, path, headers, body):
+        # Chunked upload protocol of algolions_node.upload: create/resume, chunk, complete
+        parts = path[len("/api/result-uploads/"):].strip("/").split("/")
+        with self.lock:
+            if parts == [""]:
+                meta = json.loads(body)
+                upload_id = hashlib.sha256(f"{meta['job_id']}:{meta['sha256']}".encode()).hexdigest()[:16]
+                session = self.uploads.setdefault(upload_id, {"meta": meta, "data": bytearray()})
+                return 200, {"upload_id": upload_id, "offset": len(session["data"])}
+            session = self.uploads.get(parts[0])
+            if session is None:
+                return 404, {"error": "no such upload"}
+            if parts[1] == "chunk":
+                if int(headers.get("Upload-Offset", -1)) != len(session["data"]):
+                    return 409, {"offset": len(session["data"])}
+                session["data"] += body
+                self.upload_bytes += len(body)
+                return 200, {"offset": len(session["data"])}
+            meta, data = session["meta"], bytes(session["data"])
+            if meta["encoding"] == "gzip":
+                data = gzip.decompress(data)
+            elif meta["encoding"] == "zstd":
+                import zstandard
+                data = zstandard.ZstdDecompressor().decompressobj().decompress(data)
+            if hashlib.sha256(data).hexdigest() != meta["sha256"]:
+                return 422, {"error": "sha256 mismatch"}
+            self.results.setdefault(meta["job_id"], time.time())
+            return 200, {"ok": True}
+
+
+# --- Fake IPFS gateway ---
+
+class FakeGateway:
+    def __init__(self, workdir):
+        self.dir = os.path.join(workdir, "gateway")
+        os.makedirs(self.dir, exist_ok=True)
+        self.files = {}
+        self.bytes_served = 0
+        self.server, self.url = serve(self._handler())
+
+    def add(self, content, available=True):
+        cid = raw_cid(hashlib.sha256(content).digest())
+        if available:
+            path = os.path.join(self.dir, cid)
+            with open(path, "wb") as f:
+                f.write(content)
+            self.files[cid] = path
+        return cid
+
+    def add_csv(self, size_bytes, seed, available=True):
+        # Deterministic numeric CSV of roughly size_bytes
+        row = ",".join(str((seed * 31 + i) % 1000) for i in range(8)) + "\n"
+        rows = max(size_bytes // len(row), 1)
+        return self.add(("c0,c1,c2,c3,c4,c5,c6,c7\n" + row * rows).encode(), available)
+
+    def _handler(self):
+        gateway = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                cid = self.path.rsplit("/", 1)[-1]
+                path = gateway.files.get(cid)
+                if path is None:
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                size = os.path.getsize(path)
+                start = 0
+                match = re.match(r"bytes=(\d+)-", self.headers.get("Range", ""))
+                if match:
+                    start = int(match.group(1))
+                    self.send_response(206)
+                    self.send_header("Content-Range", f"bytes {start}-{size - 1}/{size}")
+                else:
+                    self.send_response(200)
+                self.send_header("Content-Length", str(size - start))
+                self.end_headers()
+                with open(path, "rb") as f:
+                    f.seek(start)
+                    for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                        self.wfile.write(chunk)
+                        gateway.bytes_served += len(chunk)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+# --- Workloads ---
+
+def build_workload(name, jobs, dataset_mb):
+    # List of (model kind, dataset bytes, dataset available, paid) per job
+    if name == "tiny":
+        return [("ok", 1024, True, False)] * (jobs or 200)
+    if name == "huge":
+        return [("ok", int((dataset_mb or 200) * 1024 * 1024), True, False)] * (jobs or 4)
+    if name == "failures":
+        kinds = [("fail", 1024, True, False), ("ok", 1024, False, False), ("ok", 1024, True, False)]
+        return [kinds[i % 3] for i in range(jobs or 60)]
+    if name == "paid":
+        kinds = [("ok", 1024, True, False), ("ok", 1024, True, True), ("fail", 1024, True, True),
+                 ("ok", 1024, False, True)]
+        return [kinds[i % 4] for i in range(jobs or 40)]
+    raise SystemExit(f"unknown workload {name}")
+
+
+def submit_workload(workload, chain, backend, gateway):
+    models = {"ok": gateway.add(MODEL_OK.encode()), "fail": gateway.add(MODEL_FAIL.encode())}
+    for i, (kind, size, available, paid) in enumerate(workload):
+        dataset_cid = gateway.add_csv(size, seed=i, available=available)
+        chain_job_id = chain.submit_job(models[kind], dataset_cid, paid)
+        backend.add_job(f"bench-{i}", chain_job_id, models[kind], dataset_cid)
+
+
+# --- Reporting ---
+
+def quantile(hist, q):
+    # Linear interpolation inside histogram buckets, like PromQL histogram_quantile()
+    total = hist["count"]
+    if not total:
+        return None
+    rank = q * total
+    seen, lower = 0, 0.0
+    for bound, n in ((float(b), n) for b, n in hist["buckets"].items()):
+        if n and seen + n >= rank:
+            return lower + (bound - lower) * (rank - seen) / n
+        seen += n
+        lower = bound
+    return lower  # in the +Inf bucket
+
+
+def parse_series(key):
+    name, _, labels = key.partition("{")
+    return name, dict(re.findall(r'(\w+)="([^"]*)"', labels))
+
+
+def latency_table(metrics, name, label):
+    rows = []
+    for key, hist in sorted(metrics.get("histograms", {}).items()):
+        series, labels = parse_series(key)
+        if series == name and hist["count"]:
+            rows.append({label: labels.get(label), "count": hist["count"],
+                         "mean": hist["sum"] / hist["count"],
+                         "p50": quantile(hist, 0.5), "p90": quantile(hist, 0.9), "p99": quantile(hist, 0.99)})
+    return rows
+
+
+def peak_rss(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def model_peak_rss(log_path):
+    # The node logs "peak RSS <n>MB" after each model run
+    peak = 0
+    with open(log_path, errors="replace") as f:
+        for match in re.finditer(r"peak RSS (\d+)MB", f.read()):
+            peak = max(peak, int(match.group(1)))
+    return peak * 1024 * 1024
+
+
+def fetch_metrics(port):
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics.json", timeout=5) as r:
+            return json.load(r)
+    except OSError:
+        return {}  # node version without a metrics endpoint
+
+
+def print_report(result):
+    print(f"\nworkload {result['workload']}: {result['jobs']} job(s) in {result['wall_seconds']:.1f}s "
+          f"-> {result['jobs_per_second']:.2f} jobs/s "
+          f"(first claim after {result['first_claim_seconds'] or 0:.1f}s)")
+    print(f"outcomes: {result['outcomes']}")
+    if len(result.get("claims_by_wallet", {})) > 1:
+        print(f"claims per wallet: {sorted(result['claims_by_wallet'].values(), reverse=True)}")
+    mb = 1024 * 1024
+    print(f"peak RSS: node {(result['node_peak_rss'] or 0) / mb:.0f}MB, "
+          f"model process {result['model_peak_rss'] / mb:.0f}MB")
+    print(f"bytes: served by gateway {result['gateway_bytes'] / mb:.1f}MB, "
+          f"uploaded to backend {result['upload_bytes'] / mb:.1f}MB")
+    for title, rows, label in (("stage", result["stages"], "stage"), ("step", result["steps"], "step")):
+        if rows:
+            print(f"\n{title:<16}{'count':>7}{'mean':>9}{'p50':>9}{'p90':>9}{'p99':>9}")
+            for r in rows:
+                print(f"{r[label]:<16}{r['count']:>7}{r['mean']:>9.3f}{r['p50']:>9.3f}{r['p90']:>9.3f}{r['p99']:>9.3f}")
+    print(f"\nRPC calls ({sum(result['rpc_calls'].values())} total):")
+    for method, n in sorted(result["rpc_calls"].items(), key=lambda kv: -kv[1]):
+        print(f"  {method:<32}{n:>7}")
+    print(f"backend calls ({sum(result['backend_calls'].values())} total):")
+    for call, n in sorted(result["backend_calls"].items(), key=lambda kv: -kv[1]):
+        print(f"  {call:<32}{n:>7}")
+
+
+# --- Runner ---
+
+def run(args):
+    workload = build_workload(args.workload, args.jobs, args.dataset_mb)
+    with tempfile.TemporaryDirectory() as workdir:
+        chain, backend, gateway = LocalChain(args.wallets), StubBackend(), FakeGateway(workdir)
+        print(f"Submitting {len(workload)} '{args.workload}' job(s)...")
+        submit_workload(workload, chain, backend, gateway)
+        start_block = chain.w3.eth.block_number + 1
+
+        metrics_port = free_port()
+        config = {
+            "wallet_address": chain.node_account.address,
+            "private_key": chain.node_account.key.hex(),
+            "api_base": backend.url,
+            "eth_node_url": chain.url,
+            "contract_address": chain.contract.address,
+            "abi_path": ABI_PATH,
+            "node_id": "benchmark-node",
+            "ipfs_gateways": [gateway.url],
+            "job_cgroups": False,
+            "metrics_port": metrics_port,
+            "log_format": "json",
+            "poll_min_interval": 0.2,
+        }
+        if args.wallets > 1:
+            config["identities"] = [{"wallet_address": a.address, "private_key": a.key.hex(), "node_id": f"benchmark-node-{n}"}
+                                    for n, a in enumerate(chain.node_accounts)]
+        for item in args.set:
+            key, _, value = item.partition("=")
+            try:
+                config[key] = json.loads(value)
+            except ValueError:
+                config[key] = value
+        node_dir = os.path.join(workdir, "node")
+        os.makedirs(node_dir)
+        with open(os.path.join(node_dir, "node_config.json"), "w") as f:
+            json.dump(config, f)
+
+        env = dict(os.environ, PYTHONPATH=os.path.abspath(args.repo), LOG_FORMAT="json")
+        log_path = os.path.join(workdir, "node.log")
+        started = time.time()
+        with open(log_path, "w") as log_file:
+            node = subprocess.Popen([sys.executable, "-m", "algolions_node.node"], cwd=node_dir, env=env,
+                                    stdout=log_file, stderr=subprocess.STDOUT)
+        outcomes, first_claim, next_block = {}, None, start_block
+        try:
+            while len(outcomes) < len(workload) and time.time() - started < args.timeout:
+                if node.poll() is not None:
+                    raise SystemExit(f"node exited with {node.returncode}; see its log:\n" + open(log_path).read()[-4000:])
+                finished, next_block = chain.finished_jobs(next_block)
+                outcomes.update(finished)
+                if first_claim is None and backend.claimed:
+                    first_claim = time.time() - started
+                time.sleep(0.2)
+            wall = time.time() - started
+            metrics = fetch_metrics(metrics_port)
+            node_rss = peak_rss(node.pid)
+        finally:
+            node.send_signal(signal.SIGINT)
+            try:
+                node.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                node.kill()
+                node.wait()
+
+        counts = Counter(outcomes.values())
+        counts["unfinished"] = len(workload) - len(outcomes)
+        result = {
+            "workload": args.workload,
+            "jobs": len(workload),
+            "config_overrides": args.set,
+            "wall_seconds": wall,
+            "jobs_per_second": len(outcomes) / wall if wall else 0.0,
+            "first_claim_seconds": first_claim,
+            "outcomes": dict(counts),
+            "node_peak_rss": node_rss,
+            "model_peak_rss": model_peak_rss(log_path),
+            "gateway_bytes": gateway.bytes_served,
+            "upload_bytes": backend.upload_bytes,
+            "stages": latency_table(metrics, "stage_seconds", "stage"),
+            "steps": latency_table(metrics, "step_seconds", "step"),
+            "rpc_calls": dict(chain.calls),
+            "backend_calls": dict(backend.calls),
+            "claims_by_wallet": dict(backend.claims_by_wallet),
+        }
+        if args.keep_log:
+            with open(log_path) as src, open(args.keep_log, "w") as dst:
+                dst.write(src.read())
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end node throughput benchmark")
+    parser.add_argument("--workload", default="tiny", choices=["tiny", "huge", "failures", "paid"])
+    parser.add_argument("--jobs", type=int, help="number of jobs (default depends on the workload)")
+    parser.add_argument("--dataset-mb", type=float, help="dataset size for the 'huge' workload (default 200)")
+    parser.add_argument("--wallets", type=int, default=1, help="executor wallets run by the one node process")
+    parser.add_argument("--set", action="append", default=[], metavar="KEY=VALUE",
+                        help="override a node_config.json key, e.g. --set warm_executor=false")
+    parser.add_argument("--repo", default=REPO_ROOT, help="checkout whose algolions_node package to run")
+    parser.add_argument("--timeout", type=float, default=900)
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--keep-log", help="copy the node's log to this file")
+    args = parser.parse_args()
+
+    result = run(args)
+    print_report(result)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -13,4 +13,4 @@ if [ ! -f "$NODE_WALLET_PATH" ] || [ ! -f "$NODE_CONFIG_PATH" ]; then
 fi
 
 echo "✅ [Setup] Wallet/config ready!"
-exec python3 /nodes/algolions_node/node.py --wallet "$NODE_WALLET_PATH" --config "$NODE_CONFIG_PATH" --abi "$ABI_PATH"
+exec python3 -m algolions_node.node --wallet "$NODE_WALLET_PATH" --config "$NODE_CONFIG_PATH" --abi "$ABI_PATH"